@@ -0,0 +1,161 @@
+"""Admission control, and reaping idle connections.
+
+A flood of connections, or callers who walk away with the line still
+open, would otherwise hold Sessions forever. `AdmissionControl` caps
+the number of sessions, in total and per remote host, and callers who
+are turned away get a pre-rendered "all lines busy" screen rather than
+a Session. `IdleReaper` closes connections that have sent nothing for
+a while.
+
+The reaper keeps every connection in a single heap of deadlines, with
+one timer for the earliest of them, rather than a task or timer per
+connection. Connections only note the time of each read. A deadline
+that comes due for a connection that has been active since is pushed
+back at that point, so the heap is never touched per read.
+"""
+
+import heapq
+import asyncio
+import itertools
+
+from .framebuffer import FrameBuffer
+from .petscii import *
+
+
+class AdmissionControl:
+    """Counts sessions, and decides whether to accept a new one.
+
+    :Parameters:
+        `max_sessions` : int
+            The most sessions at once, or None for no limit.
+        `max_per_host` : int
+            The most sessions at once from a single remote host, or
+            None for no limit.
+    """
+
+    def __init__(self, max_sessions=None, max_per_host=None):
+        self.max_sessions = max_sessions
+        self.max_per_host = max_per_host
+        self.sessions = 0
+        # Remote host -> number of sessions:
+        self._hosts = {}
+        # Reason -> number of callers turned away:
+        self.refused = {}
+
+    def admit(self, host):
+        """Count a new session from `host`, if there is room.
+
+        Returns None if it was admitted, or the reason it was refused:
+        'full' or 'host'.
+        """
+        if self.max_sessions is not None and self.sessions >= self.max_sessions:
+            reason = 'full'
+        elif self.max_per_host is not None and self._hosts.get(host, 0) >= self.max_per_host:
+            reason = 'host'
+        else:
+            self.sessions += 1
+            self._hosts[host] = self._hosts.get(host, 0) + 1
+            return None
+        self.refused[reason] = self.refused.get(reason, 0) + 1
+        return reason
+
+    def release(self, host):
+        """Uncount a session from `host`, once it has closed."""
+        self.sessions -= 1
+        count = self._hosts.pop(host) - 1
+        if count:
+            self._hosts[host] = count
+
+
+class IdleReaper:
+    """Closes connections that have received nothing for `timeout` seconds.
+
+    Connections are expected to have a `last_received` time, from the
+    event loop's clock, and a `close` method.
+
+    :Parameters:
+        `timeout` : float
+            Seconds without input before a connection is closed.
+        `resolution` : float
+            Deadlines are rounded up to a multiple of this, so that
+            connections that go idle around the same time are reaped
+            by the same timer.
+    """
+
+    def __init__(self, timeout, resolution=1.0):
+        self.timeout = timeout
+        self.resolution = resolution
+        self.reaped = 0
+        # Heap of (deadline, sequence, connection):
+        self._deadlines = []
+        self._sequence = itertools.count()
+        self._watched = set()
+        self._timer = None
+        self._timer_deadline = None
+        self._loop = asyncio.get_event_loop()
+
+    def __len__(self):
+        return len(self._watched)
+
+    def add(self, connection):
+        """Start watching a connection."""
+        self._watched.add(connection)
+        deadline = self._push(connection)
+        if self._timer is None or deadline < self._timer_deadline:
+            self._schedule(deadline)
+
+    def remove(self, connection):
+        """Stop watching a connection. Its deadline is discarded when it comes due."""
+        self._watched.discard(connection)
+        if not self._watched and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            self._deadlines.clear()
+
+    def _push(self, connection):
+        deadline = connection.last_received + self.timeout
+        # Round up, so that deadlines share timers:
+        deadline = -(-deadline // self.resolution) * self.resolution
+        heapq.heappush(self._deadlines, (deadline, next(self._sequence), connection))
+        return deadline
+
+    def _schedule(self, deadline):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._loop.call_at(deadline, self._expire)
+        self._timer_deadline = deadline
+
+    def _expire(self):
+        self._timer = None
+        now = self._loop.time()
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            _deadline, _sequence, connection = heapq.heappop(deadlines)
+            if connection not in self._watched:
+                continue
+            if connection.last_received + self.timeout > now:
+                # Active since this deadline was set:
+                self._push(connection)
+                continue
+            self._watched.discard(connection)
+            self.reaped += 1
+            connection.close()
+        if deadlines:
+            self._schedule(deadlines[0][0])
+
+
+def render_busy_screen(assets=None):
+    """Return the PETSCII for the "all lines busy" screen.
+
+    This is ``busy.seq`` from `assets`, if there is one, or else a
+    plain message. Either way, it is rendered once, and sent as is to
+    every caller who is turned away.
+    """
+    if assets is not None and 'busy.seq' in assets:
+        return CLEAR + bytes(assets['busy.seq'])
+
+    display = FrameBuffer()
+    display.write(LOUP_CHARSET + WHITE + CLEAR)
+    display.write(display.plan_move(10, 10) + YELLOW + encode_petscii("All lines are busy."))
+    display.write(display.plan_move(7, 12) + LIGHT_GREEN + encode_petscii("Please call again later!"))
+    return CLEAR + FrameBuffer().render(display)
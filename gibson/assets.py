@@ -0,0 +1,194 @@
+"""Packed resource bundles.
+
+The files in a resource directory (such as the .seq screens) are packed
+into a single indexed bundle file, which is memory mapped once and shared
+by every Session. Assets are handed out as zero-copy `memoryview` slices
+of the mapping, so showing a screen never touches the disk.
+
+Bundle layout (all integers little endian)::
+
+    header:  magic (4s), version (H), entry count (I)
+    entry:   name length (H), name (utf-8), offset (Q), size (Q), mtime (q)
+    data:    the file contents, back to back
+"""
+
+import os
+import mmap
+import struct
+
+
+_MAGIC = b'GIBS'
+_VERSION = 1
+_header = struct.Struct('<4sHI')
+_name_length = struct.Struct('<H')
+_entry = struct.Struct('<QQq')
+
+
+class AssetError(Exception):
+    """An exception raised when a bundle file can not be read."""
+    pass
+
+
+def _scan(directory):
+    """Return a sorted list of (name, path, stat) for the files in a directory."""
+    files = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and not entry.name.startswith('.'):
+            files.append((entry.name, entry.path, entry.stat()))
+    return sorted(files)
+
+
+def pack(directory, filename):
+    """Pack all files in a directory into a single bundle file.
+
+    The bundle is written to a temporary file first, and then moved into
+    place, so any existing mappings of an older bundle stay valid.
+
+    :Parameters:
+        `directory` : str
+            The directory containing the resource files.
+        `filename` : str
+            The bundle file to create.
+    """
+    files = _scan(directory)
+    names = [name.encode() for name, _path, _stat in files]
+    offset = _header.size + sum(_name_length.size + len(name) + _entry.size for name in names)
+
+    index = b''
+    contents = []
+    for encoded, (_name, path, stat) in zip(names, files):
+        with open(path, 'rb') as f:
+            data = f.read()
+        index += _name_length.pack(len(encoded)) + encoded + _entry.pack(offset, len(data), stat.st_mtime_ns)
+        contents.append(data)
+        offset += len(data)
+
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(_header.pack(_MAGIC, _VERSION, len(files)))
+        f.write(index)
+        f.writelines(contents)
+    os.replace(temporary, filename)
+
+
+def _read_index(buffer):
+    try:
+        magic, version, count = _header.unpack_from(buffer, 0)
+    except struct.error:
+        raise AssetError("Bundle is truncated")
+    if magic != _MAGIC or version != _VERSION:
+        raise AssetError("Not a bundle, or an unsupported version")
+
+    index = {}
+    position = _header.size
+    for _ in range(count):
+        length, = _name_length.unpack_from(buffer, position)
+        position += _name_length.size
+        name = bytes(buffer[position:position + length]).decode()
+        position += length
+        index[name] = _entry.unpack_from(buffer, position)
+        position += _entry.size
+    return index
+
+
+class AssetBundle:
+    """A read-only, memory mapped collection of resource files.
+
+    The bundle is (re)packed from the source directory when it is first
+    opened, if it is missing or out of date.
+
+    :Parameters:
+        `directory` : str
+            The directory containing the resource files.
+        `filename` : str
+            The bundle file. Defaults to the directory name, with a
+            ".bundle" extension.
+        `check_stat` : bool
+            Stat the source file each time an asset is requested, and
+            repack the bundle if it has changed. This is intended for
+            development only, as it puts a system call on the hot path.
+    """
+
+    def __init__(self, directory, filename=None, check_stat=False):
+        self._directory = directory
+        self._filename = filename or os.path.normpath(directory) + '.bundle'
+        self._check_stat = check_stat
+
+        self._mmap = None
+        self._view = None
+        self._index = {}
+        self._generation = 0
+
+        self._open()
+        if self._is_stale():
+            self.repack()
+
+    def _open(self):
+        try:
+            with open(self._filename, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Missing or empty. It will be (re)packed.
+            self._mmap, self._view, self._index = None, None, {}
+            return
+
+        view = memoryview(mapping)
+        try:
+            index = _read_index(view)
+        except AssetError:
+            index = {}
+
+        # Any slices from the previous mapping are still valid.
+        # It will be unmapped once they have all been released.
+        self._mmap, self._view, self._index = mapping, view, index
+        self._generation += 1
+
+    def _is_stale(self):
+        files = _scan(self._directory)
+        if len(files) != len(self._index):
+            return True
+        for name, _path, stat in files:
+            entry = self._index.get(name)
+            if entry is None or entry[1:] != (stat.st_size, stat.st_mtime_ns):
+                return True
+        return False
+
+    def repack(self):
+        """Repack the bundle from the source directory, and remap it."""
+        pack(self._directory, self._filename)
+        self._open()
+
+    @property
+    def generation(self):
+        """A number that changes whenever the bundle is remapped.
+
+        Anything built from the assets can keep this, to know when to
+        build it again. With `check_stat`, the source directory is
+        checked first.
+        """
+        if self._check_stat and self._is_stale():
+            self.repack()
+        return self._generation
+
+    @property
+    def names(self):
+        """The names of all assets in the bundle."""
+        return list(self._index)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        """Get an asset by name, as a read-only `memoryview`."""
+        if self._check_stat:
+            try:
+                stat = os.stat(os.path.join(self._directory, name))
+                current = stat.st_size, stat.st_mtime_ns
+            except FileNotFoundError:
+                current = None
+            entry = self._index.get(name)
+            if current != (entry and entry[1:]):
+                self.repack()
+
+        offset, size, _mtime = self._index[name]
+        return self._view[offset:offset + size]
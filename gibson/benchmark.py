@@ -0,0 +1,165 @@
+"""Micro-benchmarks for the hot paths.
+
+Everything here runs for every key a caller sends, or every screen they
+are shown: event dispatch, the PETSCII codecs, drawing on a Session's
+display, and rendering whole screens. Screens are rendered against an
+in-memory transport, so no sockets are involved.
+
+Run the suite, and save the results as a baseline::
+
+    python -m gibson.benchmark --save baseline.json
+
+Later, compare against it. Any benchmark that is more than `--threshold`
+slower than the baseline is reported, and the exit status is 1::
+
+    python -m gibson.benchmark --compare baseline.json --threshold 0.1
+"""
+
+import sys
+import json
+import timeit
+import argparse
+import platform
+
+from .bulletin import Bulletin
+from .event import EventDispatcher
+from .peephole import optimize
+from .petscii import *
+from .screens import _screen_classes
+from .server import Session
+from .testing import MemoryConnection, StubServer
+
+
+_text = "The quick brown fox jumps over the lazy dog"
+
+
+class _Dispatcher(EventDispatcher):
+    def on_receive(self, message):
+        pass
+
+
+_Dispatcher.register_event_type('on_receive')
+
+
+def _cases():
+    """Yield (name, callable) for each benchmark."""
+    dispatcher = _Dispatcher()
+    dispatcher.set_handler('on_receive', lambda message: None)
+    yield 'dispatch_event', lambda: dispatcher.dispatch_event('on_receive', b'A')
+
+    encoded = encode_petscii(_text)
+    yield 'encode_petscii', lambda: encode_petscii(_text)
+    yield 'decode_petscii', lambda: decode_petscii(encoded)
+    # split_keys is lazy, so the keys are taken out as well:
+    yield 'split_keys', lambda: list(split_keys(encoded))
+
+    server = StubServer()
+    session = Session(MemoryConnection(), server)
+    screen = session.current_screen
+
+    def send():
+        screen.send(session, encoded)
+        session.display.clear()
+
+    def send_unicode():
+        screen.send_unicode(session, _text, CYAN)
+        session.display.clear()
+
+    yield 'Screen.send', send
+    yield 'Screen.send_unicode', send_unicode
+
+    def go_to():
+        # From the same place each time, as a move to where
+        # the cursor already is plans nothing:
+        session.display.x, session.display.y = 2, 3
+        screen._go_to(session, 33, 17)
+
+    yield 'Screen._go_to', go_to
+
+    # Per caller, for an announcement that was rendered once:
+    bulletin = Bulletin(_text).render(True)
+    yield 'Session.overlay', lambda: session.overlay(bulletin)
+
+    # The optimizer, over a whole screen of artwork:
+    artwork = bytes(server.assets['mainmenu.seq'])
+    yield 'peephole optimize', lambda: optimize(artwork)
+
+    for name in sorted(_screen_classes):
+        try:
+            session.set_screen(name)
+        except Exception as exception:
+            print(f"Skipping the {name} screen: {exception!r}", file=sys.stderr)
+            continue
+
+        def activate(name=name):
+            # A full redraw, from a blank screen:
+            session.display.clear()
+            session._terminal.clear()
+            session.set_screen(name)
+            session.flush()
+
+        yield f'activate {name}', activate
+        # Drawing on the display alone, without rendering the diff:
+        yield f'set_screen {name}', lambda name=name: session.set_screen(name)
+
+
+def run(repeat=5, names=None):
+    """Run the benchmarks. Returns a dict of name -> seconds per call.
+
+    Each benchmark is timed in `repeat` rounds of about 0.2 seconds,
+    and the fastest round is kept.
+    """
+    results = {}
+    for name, function in _cases():
+        if names and name not in names:
+            continue
+        timer = timeit.Timer(function)
+        number, _time = timer.autorange()
+        results[name] = min(timer.repeat(repeat, number)) / number
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return a list of (name, ratio) for benchmarks slower than the baseline by more than `threshold`."""
+    regressions = []
+    for name, seconds in results.items():
+        if name in baseline and seconds > baseline[name] * (1 + threshold):
+            regressions.append((name, seconds / baseline[name]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m gibson.benchmark', description="Benchmark the hot paths")
+    parser.add_argument('names', nargs='*', help="only run these benchmarks")
+    parser.add_argument('--repeat', type=int, default=5, help="rounds per benchmark (defaults to 5)")
+    parser.add_argument('--save', metavar='FILE', help="save the results as JSON")
+    parser.add_argument('--compare', metavar='FILE', help="compare against a saved baseline")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="allowed slowdown against the baseline (defaults to 0.1, for 10%%)")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    results = run(args.repeat, args.names)
+    for name, seconds in results.items():
+        line = f"{name:<24}{seconds * 1e6:>10.3f}us"
+        if name in baseline:
+            line += f"{seconds / baseline[name]:>8.2f}x"
+        print(line)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'results': results}, f, indent=2)
+
+    regressions = compare(results, baseline, args.threshold)
+    for name, ratio in regressions:
+        print(f"Regression: {name} is {ratio:.2f}x the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""Shared state for servers that run as several worker processes.
+
+Each worker accepts callers on the same port (with SO_REUSEPORT), and
+the parent process runs a `Broker`, which owns anything that must look
+the same to every caller: the wall, the list of who is online, and
+broadcast events. Workers talk to it with a `BrokerClient`, over a Unix
+socket.
+
+Messages are single lines of JSON. Requests carry an "id", which is
+echoed back in the reply. Notifications have no "id", and get no reply.
+Events are pushed from the Broker to every worker, and are dispatched
+by the BrokerClient as `on_wall_entry`, `on_online` and `on_broadcast`.
+"""
+
+import json
+import asyncio
+
+from .event import EventDispatcher
+from .storage import AsyncDatabase
+from .database import Database
+from .wall import Wall, _KEY_PREFIX
+
+
+class BrokerError(Exception):
+    """An exception raised when the Broker fails a request, or is unreachable."""
+    pass
+
+
+def _encode(message):
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+class Broker:
+    """Owns the state shared by every worker.
+
+    :Parameters:
+        `path` : str
+            The Unix socket to listen on.
+        `database` : str
+            The database file. Only the Broker opens it.
+    """
+
+    def __init__(self, path, database='gibson.db'):
+        self.path = path
+        self.database = Database(database)
+        self.storage = AsyncDatabase(self.database)
+        self.wall = Wall(archive=self.storage)
+
+        # writer -> the callers online at that worker:
+        self._clients = {}
+
+    async def serve(self):
+        server = await asyncio.start_unix_server(self._handle_client, self.path)
+        async with server:
+            await server.serve_forever()
+
+    def _send_all(self, message):
+        data = _encode(message)
+        for writer in self._clients:
+            writer.write(data)
+
+    async def _handle_client(self, reader, writer):
+        self._clients[writer] = []
+        try:
+            async for line in reader:
+                self._handle_message(writer, json.loads(line))
+        except (ConnectionError, asyncio.CancelledError):
+            # Cancelled when the Broker shuts down:
+            pass
+        finally:
+            del self._clients[writer]
+            writer.close()
+            self._send_online()
+
+    def _handle_message(self, writer, message):
+        request_id = message.pop('id', None)
+        handler = getattr(self, '_op_' + message.pop('op'))
+        try:
+            result = handler(writer, **message)
+        except Exception as exception:
+            result = exception
+
+        if request_id is None:
+            if isinstance(result, Exception):
+                print("Broker request failed:", result)
+            return
+        if asyncio.isfuture(result) or asyncio.iscoroutine(result):
+            # Reply once it is done, without holding up the other requests:
+            future = asyncio.ensure_future(result)
+            future.add_done_callback(lambda future: self._reply(writer, request_id, future))
+        elif isinstance(result, Exception):
+            writer.write(_encode({'id': request_id, 'error': str(result)}))
+        else:
+            writer.write(_encode({'id': request_id, 'result': result}))
+
+    def _reply(self, writer, request_id, future):
+        if writer.is_closing():
+            return
+        if future.exception() is not None:
+            writer.write(_encode({'id': request_id, 'error': str(future.exception())}))
+        else:
+            writer.write(_encode({'id': request_id, 'result': future.result()}))
+
+    # Requests:
+
+    def _op_hello(self, writer):
+        return {'count': len(self.wall), 'recent': self.wall.get_recent(SharedWall.recent),
+                'online': self._get_online()}
+
+    def _op_post(self, writer, text):
+        number = len(self.wall)
+        saved = self.wall.post(text)
+        # Announced straight away, as a single process server would show it:
+        self._send_all({'event': 'wall_entry', 'number': number, 'entry': self.wall.get_recent(1)[0]})
+        return saved
+
+    async def _op_scan(self, writer, start, stop):
+        if not (start.startswith(_KEY_PREFIX) and stop.startswith(_KEY_PREFIX)):
+            raise BrokerError("Only the wall can be scanned")
+        return await self.storage.scan(start, stop)
+
+    def _op_presence(self, writer, callers):
+        self._clients[writer] = callers
+        self._send_online()
+
+    def _op_broadcast(self, writer, topic, data):
+        self._send_all({'event': 'broadcast', 'topic': topic, 'data': data})
+
+    def _get_online(self):
+        return [caller for callers in self._clients.values() for caller in callers]
+
+    def _send_online(self):
+        self._send_all({'event': 'online', 'callers': self._get_online()})
+
+
+class BrokerClient(EventDispatcher):
+    """A worker's connection to the Broker.
+
+    :Parameters:
+        `path` : str
+            The Broker's Unix socket.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._reader = None
+        self._writer = None
+        self._requests = {}
+        self._next_id = 0
+        self._read_task = None
+
+    async def connect(self, timeout=10.0):
+        """Connect to the Broker, waiting up to `timeout` seconds for it to start."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            try:
+                self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if loop.time() > deadline:
+                    raise BrokerError(f"No Broker at {self.path}")
+                await asyncio.sleep(0.05)
+        self._read_task = loop.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for line in self._reader:
+                message = json.loads(line)
+                if 'id' in message:
+                    future = self._requests.pop(message['id'], None)
+                    if future is None or future.done():
+                        # The caller stopped waiting for it:
+                        continue
+                    if 'error' in message:
+                        future.set_exception(BrokerError(message['error']))
+                    else:
+                        future.set_result(message.get('result'))
+                else:
+                    event = message.pop('event')
+                    self.dispatch_event('on_' + event, *message.values())
+        except ConnectionError:
+            pass
+        finally:
+            for future in self._requests.values():
+                if not future.done():
+                    future.set_exception(BrokerError("Lost the connection to the Broker"))
+            self._requests.clear()
+            self.dispatch_event('on_broker_lost')
+
+    def request(self, op, **kwargs):
+        """Send a request. Returns a Future for the reply."""
+        self._next_id += 1
+        future = self._requests[self._next_id] = asyncio.get_running_loop().create_future()
+        self._writer.write(_encode({'id': self._next_id, 'op': op, **kwargs}))
+        return future
+
+    def notify(self, op, **kwargs):
+        """Send a request that gets no reply."""
+        self._writer.write(_encode({'op': op, **kwargs}))
+
+    async def scan(self, start=None, stop=None):
+        """Return a sorted list of (key, value) pairs from the wall, with start <= key < stop."""
+        return await self.request('scan', start=start, stop=stop)
+
+    def on_wall_entry(self, number, entry):
+        """Event for an entry posted to the wall, by any worker."""
+
+    def on_online(self, callers):
+        """Event for a change to the list of callers online, at any worker."""
+
+    def on_broadcast(self, topic, data):
+        """Event for a broadcast, sent by any worker."""
+
+    def on_broker_lost(self):
+        """Event for the connection to the Broker closing."""
+
+
+BrokerClient.register_event_type('on_wall_entry')
+BrokerClient.register_event_type('on_online')
+BrokerClient.register_event_type('on_broadcast')
+BrokerClient.register_event_type('on_broker_lost')
+
+
+class SharedWall(Wall):
+    """A worker's view of the Broker's wall.
+
+    The most recent entries are kept in memory, just like `Wall`, and
+    kept up to date by the Broker. Posts, and pages older than those in
+    memory, go to the Broker.
+
+    :Parameters:
+        `client` : `BrokerClient`
+            The connection to the Broker.
+    """
+
+    recent = 100
+
+    def __init__(self, client, cached_pages=32):
+        super().__init__(archive=client, recent=self.recent, cached_pages=cached_pages)
+        client.set_handler('on_wall_entry', self._add_entry)
+
+    def _load(self):
+        # Filled in by `sync`, once connected:
+        pass
+
+    async def sync(self):
+        """Fetch the current entries from the Broker.
+
+        Returns the reply to the hello request.
+        """
+        reply = await self._archive.request('hello')
+        self._recent.clear()
+        self._recent.extend(reply['recent'])
+        self._count = reply['count']
+        self._pages.clear()
+        return reply
+
+    def _add_entry(self, number, entry):
+        if number == self._count:
+            self._recent.append(entry)
+            self._count += 1
+            self._pages.clear()
+            self.dispatch_event('on_entry', number, entry)
+
+    def post(self, text):
+        """Post a new entry to the wall, through the Broker.
+
+        The entry appears once the Broker announces it to every
+        worker. Returns a Future that is done once it has been written
+        to the archive.
+        """
+        return self._archive.request('post', text=text)
@@ -0,0 +1,45 @@
+"""Announcements, shown over the top row of every caller's screen.
+
+A `Bulletin` is rendered to PETSCII once for each character set, the
+first time it is needed, and the same bytes object is then handed to
+every Session. Each Session sends it as is, through its own paced
+connection, rather than drawing and diffing it separately. See
+:py:meth:`gibson.server.Session.overlay`.
+"""
+
+from .framebuffer import WIDTH
+from .petscii import *
+
+
+class Bulletin:
+    """A single line announcement.
+
+    :Parameters:
+        `text` : str
+            The announcement. Anything past the width of the screen
+            is cut off.
+        `colour` : bytes
+            The PETSCII colour code to show it in.
+    """
+
+    __slots__ = 'text', 'colour', '_rendered'
+
+    def __init__(self, text, colour=YELLOW):
+        self.text = text
+        self.colour = colour
+        # lowercase -> PETSCII:
+        self._rendered = {}
+
+    def render(self, lowercase):
+        """Return the PETSCII for the bulletin, in the given character set.
+
+        It starts from HOME, so it can be sent wherever the cursor is.
+        The last column is left alone, so that printing never wraps.
+        """
+        lowercase = bool(lowercase)
+        rendered = self._rendered.get(lowercase)
+        if rendered is None:
+            line = self.text[:WIDTH - 1].ljust(WIDTH - 1)
+            rendered = self._rendered[lowercase] = (HOME + REVERSE_ON + self.colour +
+                                                    encode_petscii(line, 'replace', lowercase) + REVERSE_OFF)
+        return rendered
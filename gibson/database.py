@@ -1,18 +1,341 @@
+"""A small log structured key/value store.
+
+Every update is appended to a single log file as a record, and an
+in-memory index maps each key to the position of its latest value.
+The index is rebuilt by reading the log when the Database is opened.
+Overwritten and deleted values are left behind as garbage in the log,
+until a background compaction rewrites it with only the live records.
+
+Record layout (all integers little endian)::
+
+    crc32 (I), key length (I), value length (I), flags (B), key, value
+
+Keys are strings, and values are anything that can be serialized
+to JSON.
+"""
+
+import os
+import json
+import mmap
+import time
+import struct
+import bisect
+import zlib
 import threading
 
-# TODO: finish this
+
+_record = struct.Struct('<IIIB')
+_crc = struct.Struct('<I')
+_body = struct.Struct('<IIB')
+_TOMBSTONE = 1
+
+
+class DatabaseError(Exception):
+    """An exception raised when the Database is used after closing."""
+    pass
+
+
+def _encode_record(key, value, flags=0):
+    body = _body.pack(len(key), len(value), flags) + key + value
+    return _crc.pack(zlib.crc32(body)) + body
 
 
 class Database:
-    def __init__(self, filename='db.json'):
+    """A persistent key/value store.
+
+    :Parameters:
+        `filename` : str
+            The log file. It is created if it does not exist.
+        `sync` : bool
+            If True, `update` and `delete` do not return until the change
+            has been flushed to disk. Concurrent writers share a single
+            fsync (group commit).
+        `sync_interval` : float
+            How long, in seconds, the syncing thread waits to gather more
+            writes before each fsync.
+        `compact_ratio` : float
+            Compact the log once this fraction of it is garbage.
+        `compact_min_size` : int
+            Never compact logs smaller than this many bytes.
+    """
+
+    def __init__(self, filename='gibson.db', sync=True, sync_interval=0.005,
+                 compact_ratio=0.5, compact_min_size=1 << 20):
+        self._filename = filename
+        self._sync = sync
+        self._sync_interval = sync_interval
+        self._compact_ratio = compact_ratio
+        self._compact_min_size = compact_min_size
+
         self._lock = threading.Lock()
-        self._db = {}
+        self._synced = threading.Condition(self._lock)
+        self._compact_lock = threading.Lock()
+
+        # key -> (value offset, value length):
+        self._index = {}
+        self._keys = []
+        self._size = 0
+        self._garbage = 0
+
+        # Appends are numbered, so that writers can tell when theirs is on disk:
+        self._appended = 0
+        self._synced_count = 0
+        self._closed = False
+        self._compacting = False
+
+        self._fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+        self._load()
+
+        self._sync_thread = threading.Thread(target=self._sync_loop, name='Database sync', daemon=True)
+        self._sync_thread.start()
+
+    # Loading:
+
+    def _load(self):
+        """Rebuild the index from the log, dropping any torn record at the end."""
+        size = os.fstat(self._fd).st_size
+        position = 0
+        if size:
+            with mmap.mmap(self._fd, size, access=mmap.ACCESS_READ) as mapping:
+                data = memoryview(mapping)
+                while position + _record.size <= size:
+                    crc, key_length, value_length, flags = _record.unpack_from(data, position)
+                    start = position + _record.size
+                    end = start + key_length + value_length
+                    if end > size or zlib.crc32(data[position + _crc.size:end]) != crc:
+                        break
+                    key = bytes(data[start:start + key_length]).decode()
+                    self._apply(key, start + key_length, value_length, flags, end - position)
+                    position = end
+                data.release()
+
+        if position != size:
+            os.ftruncate(self._fd, position)
+        self._size = position
+
+    def _apply(self, key, offset, length, flags, record_size):
+        """Update the index for a record that is in the log."""
+        old = self._index.pop(key, None)
+        if old is None:
+            if not flags & _TOMBSTONE:
+                bisect.insort(self._keys, key)
+        else:
+            self._garbage += _record.size + len(key.encode()) + old[1]
+            if flags & _TOMBSTONE:
+                del self._keys[bisect.bisect_left(self._keys, key)]
+
+        if flags & _TOMBSTONE:
+            self._garbage += record_size
+        else:
+            self._index[key] = offset, length
+
+    # Writing:
+
+    def _append(self, entries):
+        """Append (key, value, flags) records in a single write."""
+        records = []
+        for key, value, flags in entries:
+            encoded = key.encode()
+            records.append((key, encoded, value, flags, _encode_record(encoded, value, flags)))
+
+        with self._lock:
+            if self._closed:
+                raise DatabaseError("The Database is closed")
+            os.pwrite(self._fd, b''.join(record[-1] for record in records), self._size)
+            for key, encoded, value, flags, record in records:
+                self._apply(key, self._size + _record.size + len(encoded), len(value), flags, len(record))
+                self._size += len(record)
+            self._appended += 1
+            number = self._appended
+            self._synced.notify_all()
+
+            if self._sync:
+                while self._synced_count < number and not self._closed:
+                    self._synced.wait()
+
+            if self._should_compact():
+                self._compacting = True
+                threading.Thread(target=self.compact, name='Database compaction', daemon=True).start()
+
+    @staticmethod
+    def _dumps(value):
+        return json.dumps(value, separators=(',', ':')).encode()
 
     def update(self, key, value):
+        """Set the value for a key."""
+        self._append([(key, self._dumps(value), 0)])
+
+    def update_many(self, items):
+        """Set the values for several keys at once.
+
+        The records are appended in a single write, and share a
+        single sync.
+
+        :Parameters:
+            `items` : iterable
+                (key, value) pairs. Later pairs win if a key repeats.
+        """
+        entries = [(key, self._dumps(value), 0) for key, value in items]
+        if entries:
+            self._append(entries)
+
+    def delete(self, key):
+        """Remove a key. No error is raised if it does not exist."""
+        with self._lock:
+            if key not in self._index:
+                return
+        self._append([(key, b'', _TOMBSTONE)])
+
+    def _sync_loop(self):
+        with self._lock:
+            while not self._closed:
+                if self._synced_count == self._appended:
+                    self._synced.wait()
+                    continue
+
+                # Give other writers a moment to join this commit:
+                self._lock.release()
+                try:
+                    time.sleep(self._sync_interval)
+                finally:
+                    self._lock.acquire()
+                if self._closed:
+                    # Synced, and closed, in the meantime:
+                    break
+
+                number = self._appended
+                os.fsync(self._fd)
+                self._synced_count = number
+                self._synced.notify_all()
+
+    # Reading:
+
+    def _read(self, key):
+        offset, length = self._index[key]
+        return json.loads(os.pread(self._fd, length, offset))
+
+    def get(self, key, default=None):
+        """Get the value for a key, or `default` if it does not exist."""
+        with self._lock:
+            if key not in self._index:
+                return default
+            return self._read(key)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def keys(self, start=None, stop=None):
+        """Return a sorted list of the keys with start <= key < stop.
+
+        Only the index is consulted, so this never reads from disk.
+        """
         with self._lock:
-            self._db[key] = value
+            return self._keys[self._bisect(start, 0):self._bisect(stop, len(self._keys))]
 
-    def get(self, key):
+    def _bisect(self, key, default):
+        return default if key is None else bisect.bisect_left(self._keys, key)
+
+    def scan(self, start=None, stop=None):
+        """Return a sorted list of (key, value) pairs, with start <= key < stop.
+
+        Either bound may be None, to leave that end of the range open.
+        """
+        with self._lock:
+            keys = self._keys[self._bisect(start, 0):self._bisect(stop, len(self._keys))]
+            return [(key, self._read(key)) for key in keys]
+
+    def scan_prefix(self, prefix):
+        """Return a sorted list of (key, value) pairs whose keys start with `prefix`."""
         with self._lock:
-            return self._db.get([key], None)
+            first = bisect.bisect_left(self._keys, prefix)
+            last = first
+            while last < len(self._keys) and self._keys[last].startswith(prefix):
+                last += 1
+            return [(key, self._read(key)) for key in self._keys[first:last]]
+
+    # Compaction:
+
+    def _should_compact(self):
+        return (not self._compacting and self._size >= self._compact_min_size and
+                self._garbage >= self._size * self._compact_ratio)
+
+    def compact(self):
+        """Rewrite the log with only the live records.
+
+        Writes may continue while the live records are copied. Only
+        the final swap of the old log for the new one holds the lock.
+        """
+        with self._compact_lock:
+            try:
+                self._compact()
+            finally:
+                self._compacting = False
+
+    def _compact(self):
+        temporary = self._filename + '.compact'
+        with self._lock:
+            if self._closed:
+                return
+            snapshot = [(key, self._index[key]) for key in self._keys]
+            end = self._size
+            fd = self._fd
+
+        index = {}
+        position = 0
+        try:
+            with open(temporary, 'wb') as f:
+                for key, (offset, length) in snapshot:
+                    encoded = key.encode()
+                    f.write(_encode_record(encoded, os.pread(fd, length, offset)))
+                    index[key] = position + _record.size + len(encoded), length
+                    position += _record.size + len(encoded) + length
+
+                with self._lock:
+                    if self._closed:
+                        return
+                    # Bring across anything that was written in the meantime:
+                    tail = os.pread(fd, self._size - end, end)
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                    os.replace(temporary, self._filename)
+                    self._fd = os.open(self._filename, os.O_RDWR)
+                    os.close(fd)
+
+                    self._index = index
+                    self._keys = [key for key, _entry in snapshot]
+                    self._garbage = 0
+                    offset = 0
+                    while offset < len(tail):
+                        _crc, key_length, value_length, flags = _record.unpack_from(tail, offset)
+                        start = offset + _record.size
+                        key = tail[start:start + key_length].decode()
+                        record_size = _record.size + key_length + value_length
+                        self._apply(key, position + start + key_length, value_length, flags, record_size)
+                        offset += record_size
+                    self._size = position + len(tail)
+                    # The new log, tail included, has been synced:
+                    self._synced_count = self._appended
+                    self._synced.notify_all()
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def close(self):
+        """Flush everything to disk, and close the log.
 
+        A compaction that is under way is finished first, as it reads
+        from the log.
+        """
+        with self._compact_lock, self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._synced.notify_all()
+        self._sync_thread.join()
@@ -176,6 +176,10 @@ class EventDispatcher:
     # Placeholder empty stack; real stack is created only if needed
     _event_stack = ()
 
+    # Event type -> the stack frames with a handler for it. Rebuilt
+    # on demand, after anything changes the stack:
+    _handler_cache = None
+
     @classmethod
     def register_event_type(cls, name):
         """Register an event type with the dispatcher.
@@ -209,6 +213,7 @@ class EventDispatcher:
 
         # Place dict full of new handlers at beginning of stack
         self._event_stack.insert(0, {})
+        self._handler_cache = None
         self.set_handlers(*args, **kwargs)
 
     def _get_handlers(self, args, kwargs):
@@ -269,6 +274,7 @@ class EventDispatcher:
             self._event_stack = [{}]
 
         self._event_stack[0][name] = handler
+        self._handler_cache = None
 
     def pop_handlers(self):
         """Pop the top level of event handlers off the stack.
@@ -276,6 +282,7 @@ class EventDispatcher:
         assert self._event_stack and 'No handlers pushed'
 
         del self._event_stack[0]
+        self._handler_cache = None
 
     def remove_handlers(self, *args, **kwargs):
         """Remove event handlers from the event stack.
@@ -308,6 +315,8 @@ class EventDispatcher:
         if not frame:
             return
 
+        self._handler_cache = None
+
         # Remove each handler from the frame.
         for name, handler in handlers:
             try:
@@ -341,6 +350,7 @@ class EventDispatcher:
             try:
                 if frame[name] == handler:
                     del frame[name]
+                    self._handler_cache = None
                     break
             except KeyError:
                 pass
@@ -355,9 +365,26 @@ class EventDispatcher:
         for frame in list(self._event_stack):
             if name in frame and frame[name] == handler:
                 del frame[name]
+                self._handler_cache = None
                 if not frame:
                     self._event_stack.remove(frame)
 
+    def _cache_handlers(self, event_type):
+        """Find, and cache, the stack frames with a handler for an event type."""
+        assert hasattr(self, 'event_types'), (
+            "No events registered on this EventDispatcher. "
+            "You need to register events with the class method "
+            "EventDispatcher.register_event_type('event_name')."
+        )
+        assert event_type in self.event_types,\
+            "%r not found in %r.event_types == %r" % (event_type, self, self.event_types)
+
+        if self._handler_cache is None:
+            self._handler_cache = {}
+        frames = tuple(frame for frame in self._event_stack if frame.get(event_type, None))
+        self._handler_cache[event_type] = frames
+        return frames
+
     def dispatch_event(self, event_type, *args):
         """Dispatch a single event to the attached handlers.
 
@@ -385,30 +412,43 @@ class EventDispatcher:
             is always ``None``.
 
         """
-        assert hasattr(self, 'event_types'), (
-            "No events registered on this EventDispatcher. "
-            "You need to register events with the class method "
-            "EventDispatcher.register_event_type('event_name')."
-        )
-        assert event_type in self.event_types,\
-            "%r not found in %r.event_types == %r" % (event_type, self, self.event_types)
+        try:
+            frames = self._handler_cache[event_type]
+        except (TypeError, KeyError):
+            frames = self._cache_handlers(event_type)
 
         invoked = False
 
-        # Search handler stack for matching event handlers
-        for frame in list(self._event_stack):
-            handler = frame.get(event_type, None)
-            if not handler:
-                continue
-            if isinstance(handler, WeakMethod):
-                handler = handler()
-                assert handler is not None
-            try:
-                invoked = True
-                if handler(*args):
-                    return EVENT_HANDLED
-            except TypeError as exception:
-                self._raise_dispatch_exception(event_type, args, handler, exception)
+        if len(frames) == 1:
+            # The usual case, of a single handler:
+            handler = frames[0].get(event_type, None)
+            if handler:
+                if isinstance(handler, WeakMethod):
+                    handler = handler()
+                    assert handler is not None
+                try:
+                    invoked = True
+                    if handler(*args):
+                        return EVENT_HANDLED
+                except TypeError as exception:
+                    self._raise_dispatch_exception(event_type, args, handler, exception)
+
+        else:
+            # Search handler stack for matching event handlers. The frames
+            # are a snapshot, so handlers may safely change the stack:
+            for frame in frames:
+                handler = frame.get(event_type, None)
+                if not handler:
+                    continue
+                if isinstance(handler, WeakMethod):
+                    handler = handler()
+                    assert handler is not None
+                try:
+                    invoked = True
+                    if handler(*args):
+                        return EVENT_HANDLED
+                except TypeError as exception:
+                    self._raise_dispatch_exception(event_type, args, handler, exception)
 
         # Check instance for an event handler
         try:
@@ -0,0 +1,465 @@
+"""A virtual model of the C64's 40x25 text screen.
+
+A :py:class:`FrameBuffer` interprets a PETSCII byte stream the way the C64
+screen editor does, keeping track of the character, colour and reverse
+state of every cell, as well as the cursor, pen colour and character set.
+
+Each Session keeps two of these: one that screens draw into, and one
+that mirrors what the caller's terminal is currently showing. Rather
+than sending everything that was drawn, the Session sends only the
+PETSCII needed to bring the terminal from one state to the other::
+
+    data = terminal.render(display)
+
+This is a close, but not perfect model. Insert mode is not tracked,
+and wrapping onto a second physical line links the two lines together,
+but never inserts a blank line below as the real screen editor can.
+"""
+
+import re
+
+from .petscii import *
+
+
+WIDTH = 40
+HEIGHT = 25
+SIZE = WIDTH * HEIGHT
+
+# Colour value for cells and pens that have not had a colour set:
+UNKNOWN = 0xFF
+
+# The PETSCII codes that select each of the 16 colours, in VIC-II order:
+_colour_codes = (BLACK, WHITE, RED, CYAN, PURPLE, GREEN, BLUE, YELLOW,
+                 ORANGE, BROWN, PINK, DARK_GREY, GREY, LIGHT_GREEN, LIGHT_BLUE, LIGHT_GREY)
+_colours = {code[0]: number for number, code in enumerate(_colour_codes)}
+
+# Several PETSCII codes print the same glyph. Cells always hold the same one:
+_canonical = bytearray(range(256))
+_canonical[0x60:0x80] = range(0xC0, 0xE0)
+_canonical[0xE0:0xFF] = range(0xA0, 0xBF)
+_canonical[0xFF] = 0xDE
+_canonical = bytes(_canonical)
+
+_printable = re.compile(rb'[\x20\x21\x23-\x7f\xa0-\xff]+')
+_blanks = b'\x20\xa0'
+_blank_row = b'\x20' * WIDTH
+_no_reverse = bytes(WIDTH)
+
+
+class FrameBuffer:
+    """The contents and editor state of a C64 text screen."""
+
+    __slots__ = ('chars', 'colours', 'reverses', 'links', 'x', 'y',
+                 'colour', 'reverse', 'quote', 'lowercase', 'scrolls')
+
+    def __init__(self):
+        self.chars = bytearray(_blank_row * HEIGHT)
+        self.colours = bytearray([UNKNOWN]) * SIZE
+        self.reverses = bytearray(SIZE)
+        # Rows that continue the logical line above them:
+        self.links = bytearray(HEIGHT)
+
+        self.x = 0
+        self.y = 0
+        self.colour = UNKNOWN
+        self.reverse = False
+        self.quote = False
+        self.lowercase = False
+        # Running count of rows scrolled off the top:
+        self.scrolls = 0
+
+    def copy(self):
+        """Return an independent copy of this screen."""
+        other = FrameBuffer.__new__(FrameBuffer)
+        for name in self.__slots__:
+            value = getattr(self, name)
+            setattr(other, name, value[:] if type(value) is bytearray else value)
+        return other
+
+    def assign(self, other):
+        """Make this screen a copy of another, in place."""
+        self.chars[:] = other.chars
+        self.colours[:] = other.colours
+        self.reverses[:] = other.reverses
+        self.links[:] = other.links
+        self.x, self.y = other.x, other.y
+        self.colour, self.reverse, self.quote = other.colour, other.reverse, other.quote
+        self.lowercase, self.scrolls = other.lowercase, other.scrolls
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sum(buffer.__sizeof__() for buffer in
+                                             (self.chars, self.colours, self.reverses, self.links))
+
+    def clear(self):
+        self.chars[:] = _blank_row * HEIGHT
+        self.colours[:] = bytes([self.colour]) * SIZE
+        self.reverses[:] = bytes(SIZE)
+        self.links[:] = bytes(HEIGHT)
+        self.x = self.y = 0
+
+    def invalidate(self):
+        """Forget the screen contents.
+
+        Use this when the real terminal may no longer match, for example
+        after a reconnection. The next render will repaint every cell.
+        """
+        self.reverses[:] = b'\x02' * SIZE
+        self.colour = UNKNOWN
+        self.reverse = None
+        self.lowercase = None
+
+    # Interpreter:
+
+    def write(self, data):
+        """Interpret a PETSCII byte stream, as the screen editor would."""
+        match = _printable.match
+        position = 0
+        length = len(data)
+        while position < length:
+            run = match(data, position)
+            if run:
+                self._print(run.group().translate(_canonical), self.reverse)
+                position = run.end()
+            else:
+                self._control(data[position])
+                position += 1
+
+    def _print(self, run, reverse):
+        colour = bytes((self.colour,))
+        reverse = b'\x01' if reverse else b'\x00'
+        while run:
+            count = min(len(run), WIDTH - self.x)
+            start = self.y * WIDTH + self.x
+            end = start + count
+            self.chars[start:end] = run[:count]
+            self.colours[start:end] = colour * count
+            self.reverses[start:end] = reverse * count
+            run = run[count:]
+            self.x += count
+            if self.x == WIDTH:
+                # Wrapping joins the next row on to this logical line,
+                # unless this row is already the second half of one:
+                linked = not self.links[self.y]
+                self.x = 0
+                self._line_feed()
+                self.links[self.y] = linked
+
+    def _line_feed(self):
+        if self.y < HEIGHT - 1:
+            self.y += 1
+            return
+        # Scroll everything up by a row:
+        del self.chars[:WIDTH]
+        del self.colours[:WIDTH]
+        del self.reverses[:WIDTH]
+        del self.links[:1]
+        self.chars += _blank_row
+        self.colours += bytes((self.colour,)) * WIDTH
+        self.reverses += _no_reverse
+        self.links += b'\x00'
+        self.links[0] = 0
+        self.scrolls += 1
+
+    def _control(self, code):
+        if code == 0x22:
+            self._print(b'"', self.reverse)
+            self.quote = not self.quote
+        elif self.quote and code not in _quote_exempt:
+            # Control codes inside quotes are printed as reversed symbols:
+            self._print(bytes((code + 0x40,)), True)
+        elif code in _colours:
+            self.colour = _colours[code]
+        else:
+            handler = _handlers.get(code)
+            if handler:
+                handler(self)
+
+    def _return(self):
+        self.x = 0
+        self.reverse = False
+        self.quote = False
+        self._line_feed()
+        if self.links[self.y]:
+            self._line_feed()
+
+    def _cursor_right(self):
+        self.x += 1
+        if self.x == WIDTH:
+            self.x = 0
+            self._line_feed()
+
+    def _cursor_left(self):
+        if self.x > 0:
+            self.x -= 1
+        elif self.y > 0:
+            self.x = WIDTH - 1
+            self.y -= 1
+
+    def _cursor_up(self):
+        if self.y > 0:
+            self.y -= 1
+
+    def _home(self):
+        self.x = self.y = 0
+
+    def _delete(self):
+        if self.x == 0 and self.y == 0:
+            return
+        self._cursor_left()
+        start = self.y * WIDTH + self.x
+        end = self.y * WIDTH + WIDTH
+        for cells, blank in ((self.chars, 0x20), (self.colours, self.colour), (self.reverses, 0)):
+            cells[start:end - 1] = cells[start + 1:end]
+            cells[end - 1] = blank
+
+    def _insert(self):
+        start = self.y * WIDTH + self.x
+        end = self.y * WIDTH + WIDTH
+        for cells, blank in ((self.chars, 0x20), (self.colours, self.colour), (self.reverses, 0)):
+            cells[start + 1:end] = cells[start:end - 1]
+            cells[start] = blank
+
+    def _reverse_on(self):
+        self.reverse = True
+
+    def _reverse_off(self):
+        self.reverse = False
+
+    def _lowercase(self):
+        self.lowercase = True
+
+    def _uppercase(self):
+        self.lowercase = False
+
+    # Rendering:
+
+    def _cell_matches(self, other, i):
+        if self.chars[i] != other.chars[i] or self.reverses[i] != other.reverses[i]:
+            return False
+        colour = other.colours[i]
+        return colour == self.colours[i] or colour == UNKNOWN or (
+            not other.reverses[i] and other.chars[i] in _blanks)
+
+    def _row_changes(self, other, y):
+        start = y * WIDTH
+        end = start + WIDTH
+        if (self.chars[start:end] == other.chars[start:end] and
+                self.reverses[start:end] == other.reverses[start:end] and
+                self.colours[start:end] == other.colours[start:end]):
+            return 0
+        changes = sum(not self._cell_matches(other, i) for i in range(start, end))
+        if not changes:
+            # Only colours that don't show differ. Take them, so that
+            # the row matches byte for byte next time:
+            self.colours[start:end] = other.colours[start:end]
+        return changes
+
+    def _changes(self, other):
+        return sum(self._row_changes(other, y) for y in range(HEIGHT))
+
+    def matches(self, other, scrolls=True):
+        """Return True if both screens have the same contents, cursor and pen.
+
+        If `scrolls` is False, how far each has scrolled is not compared.
+        """
+        return (self.chars == other.chars and self.colours == other.colours and
+                self.reverses == other.reverses and self.links == other.links and
+                (self.x, self.y, self.colour, self.reverse, self.quote, self.lowercase) ==
+                (other.x, other.y, other.colour, other.reverse, other.quote, other.lowercase) and
+                (not scrolls or self.scrolls == other.scrolls))
+
+    def patched(self, before, after, limit=SIZE):
+        """Return a copy of this screen, with the changes from `before` to `after` applied.
+
+        Only the cells that differ between the two are taken from
+        `after`, along with its cursor. Returns None if more than
+        `limit` cells differ, or if `after` has scrolled, or changed
+        character set, since `before`.
+        """
+        if after.scrolls != before.scrolls or after.lowercase != before.lowercase:
+            return None
+        patched = self.copy()
+        changed = 0
+        for start in range(0, SIZE, WIDTH):
+            end = start + WIDTH
+            if (before.chars[start:end] == after.chars[start:end] and
+                    before.reverses[start:end] == after.reverses[start:end] and
+                    before.colours[start:end] == after.colours[start:end]):
+                continue
+            for i in range(start, end):
+                if (before.chars[i] != after.chars[i] or before.reverses[i] != after.reverses[i] or
+                        before.colours[i] != after.colours[i]):
+                    changed += 1
+                    if changed > limit:
+                        return None
+                    patched.chars[i] = after.chars[i]
+                    patched.reverses[i] = after.reverses[i]
+                    patched.colours[i] = after.colours[i]
+        patched.x, patched.y = after.x, after.y
+        return patched
+
+    def _filled_cells(self):
+        filled = 0
+        for start in range(0, SIZE, WIDTH):
+            end = start + WIDTH
+            if self.chars[start:end] != _blank_row or self.reverses[start:end] != _no_reverse:
+                filled += sum(self.chars[i] not in _blanks or self.reverses[i] for i in range(start, end))
+        return filled
+
+    def _return_row(self, row):
+        # The row a RETURN moves to, or None if it would scroll:
+        row += 1
+        if row < HEIGHT and self.links[row]:
+            row += 1
+        return row if row < HEIGHT else None
+
+    def plan_move(self, x, y):
+        """Return the cheapest PETSCII that moves the cursor to (x, y).
+
+        Relative moves, moves from HOME, moves from the start of a line
+        reached with RETURN, and moves that wrap around the ends of rows
+        are all considered. None of them will scroll the screen, and
+        the reverse state is kept.
+
+        In quote mode, the move ends with quote mode off, and no cell
+        is changed, unless the cursor is in the bottom right corner.
+        """
+        if x == self.x and y == self.y:
+            return b''
+
+        candidates = []
+        if not self.quote:
+            # Cursor keys would be printed inside quotes.
+            distance = (y * WIDTH + x) - (self.y * WIDTH + self.x)
+            candidates.append(_relative(self.x, self.y, x, y))
+            candidates.append(CURSOR_RIGHT * distance if distance > 0 else CURSOR_LEFT * -distance)
+            candidates.append(HOME + _relative(0, 0, x, y))
+
+        # RETURN goes to the start of the next logical line, and turns reverse off:
+        restore = REVERSE_ON if self.reverse else b''
+        moves = b''
+        row = self._return_row(self.y)
+        while row is not None and row <= y:
+            moves += RETURN
+            candidates.append(moves + restore + _relative(0, row, x, y))
+            row = self._return_row(row)
+
+        if not self.quote:
+            # Or go up or down first, and RETURN onto the target row:
+            for row in (y - 1, y - 2):
+                if row >= 0 and self._return_row(row) == y:
+                    candidates.append(_relative(self.x, self.y, self.x, row) + RETURN + restore + CURSOR_RIGHT * x)
+        else:
+            # Cursor keys work again after a RETURN, whichever way the target is:
+            row = self._return_row(self.y)
+            if row is not None:
+                candidates.append(RETURN + restore + min(_relative(0, row, x, y), HOME + _relative(0, 0, x, y),
+                                                         key=len))
+
+        if not candidates:
+            # In quotes, where a RETURN would scroll. Print a quote to get
+            # out of them, then put back the cell it was printed over:
+            target = self.copy()
+            target.x, target.y, target.quote = x, y, False
+            closed = self.copy()
+            closed.write(b'"')
+            move = b'"' + closed.render(target)
+            if closed.reverse != self.reverse:
+                move += REVERSE_ON if self.reverse else REVERSE_OFF
+            if closed.colour != self.colour and self.colour != UNKNOWN:
+                move += _colour_codes[self.colour]
+            return move
+        return min(candidates, key=len)
+
+    def _emit(self, out, data):
+        out += data
+        self.write(data)
+
+    def render(self, target):
+        """Bring this screen up to date with another.
+
+        Returns the PETSCII that turns a terminal showing this screen
+        into one showing `target`, and applies it to this screen.
+        """
+        out = bytearray()
+
+        if self.lowercase != target.lowercase:
+            self._emit(out, LOUP_CHARSET if target.lowercase else UPGFX_CHARSET)
+
+        # If the target scrolled, scrolling the terminal the same way
+        # can save repainting everything that moved up:
+        changes = self._changes(target)
+        scrolls = target.scrolls - self.scrolls
+        if 0 < scrolls < HEIGHT and changes:
+            scroll = self.plan_move(self.x, HEIGHT - 1) + CURSOR_DOWN * scrolls
+            scrolled = self.copy()
+            scrolled.write(scroll)
+            scrolled_changes = scrolled._changes(target)
+            if scrolled_changes + len(scroll) < changes:
+                self._emit(out, scroll)
+                changes = scrolled_changes
+        self.scrolls = target.scrolls
+
+        # When most of the screen changes, it is cheaper to clear it first:
+        if changes and changes > target._filled_cells() + 1:
+            self._emit(out, CLEAR)
+
+        for y in range(HEIGHT):
+            # Printing may spill into the next row, so check each row as it comes:
+            if not self._row_changes(target, y):
+                continue
+            for i in range(y * WIDTH, y * WIDTH + WIDTH):
+                if not self._cell_matches(target, i):
+                    self._render_cell(out, target, i)
+
+        self._emit(out, self.plan_move(target.x, target.y))
+        return bytes(out)
+
+    def _render_cell(self, out, target, i):
+        y, x = divmod(i, WIDTH)
+        char = target.chars[i]
+        # Printing on the bottom right cell would scroll the screen. Closing
+        # a quote on the last row could do the same, so these are skipped:
+        if y == HEIGHT - 1 and (x == WIDTH - 1 or x == WIDTH - 2 and char == 0x22):
+            return
+
+        piece = self.plan_move(x, y)
+        reverse = target.reverses[i]
+        if self.reverse != reverse:
+            piece += REVERSE_ON if reverse else REVERSE_OFF
+        colour = target.colours[i]
+        if colour != UNKNOWN and colour != self.colour and (reverse or char not in _blanks):
+            piece += _colour_codes[colour]
+        piece += bytes((char,))
+        if char == 0x22:
+            # A second quote ends quote mode again. It lands in the
+            # next cell, which is then repainted when it is reached.
+            piece += b'"'
+        self._emit(out, piece)
+
+
+def _relative(x0, y0, x1, y1):
+    dx = x1 - x0
+    dy = y1 - y0
+    return (CURSOR_RIGHT * dx if dx > 0 else CURSOR_LEFT * -dx) + (
+        CURSOR_DOWN * dy if dy > 0 else CURSOR_UP * -dy)
+
+
+_quote_exempt = frozenset((RETURN[0], SHIFT_RETURN[0], DELETE[0]))
+
+_handlers = {
+    RETURN[0]: FrameBuffer._return,
+    SHIFT_RETURN[0]: FrameBuffer._return,
+    CURSOR_RIGHT[0]: FrameBuffer._cursor_right,
+    CURSOR_LEFT[0]: FrameBuffer._cursor_left,
+    CURSOR_DOWN[0]: FrameBuffer._line_feed,
+    CURSOR_UP[0]: FrameBuffer._cursor_up,
+    HOME[0]: FrameBuffer._home,
+    CLEAR[0]: FrameBuffer.clear,
+    DELETE[0]: FrameBuffer._delete,
+    INSERT[0]: FrameBuffer._insert,
+    REVERSE_ON[0]: FrameBuffer._reverse_on,
+    REVERSE_OFF[0]: FrameBuffer._reverse_off,
+    LOUP_CHARSET[0]: FrameBuffer._lowercase,
+    UPGFX_CHARSET[0]: FrameBuffer._uppercase,
+}
@@ -0,0 +1,257 @@
+"""A load generator, for finding out how many callers a Server can hold.
+
+Opens a number of simulated callers against a running server. Each one
+works through a script of keystrokes, as a caller on a C64 would: DEL
+at the splash screen, through the menus, a post on the wall, and then
+logging off. The post is only made against a server started with
+`--spawn`, unless `--post` is given, so that a live board's wall is
+left alone. For every step it records:
+
+* Time to first byte: from sending the keys, to the first byte back.
+* Completion time: from sending the keys, until the screen has
+  finished drawing (no more bytes for `--settle` seconds).
+* Achieved bps: the bits received while the screen was drawing, over
+  the time it took to draw. With 8-N-1 framing, 10 bits per byte.
+
+Run it with::
+
+    python -m gibson.loadtest --clients 100 --port 6400 --bitrate 9600
+
+With `--spawn`, a server is started for the test, and its CPU time is
+reported per session.
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from .petscii import DELETE, RETURN
+from .pacing import BITS_PER_BYTE
+
+
+# (step name, keys to send). The splash screen is sent on connection:
+_script = [
+    ('splash', b''),
+    ('login', DELETE),
+    ('mainmenu', b' '),
+    ('wall', b'V'),
+    ('entry', b'Y'),
+    ('post', b'LOAD TEST POST' + RETURN * 2),
+    ('leave wall', b'N'),
+    ('refresh', b'R'),
+    ('log off', b'Q'),
+]
+
+_no_post = [step for step in _script if step[0] not in ('entry', 'post')]
+
+
+class _Step:
+    __slots__ = 'name', 'ttfb', 'completion', 'size', 'bps'
+
+    def __init__(self, name, ttfb, completion, size, bps):
+        self.name = name
+        self.ttfb = ttfb
+        self.completion = completion
+        self.size = size
+        self.bps = bps
+
+
+async def _read_screen(reader, settle, timeout):
+    """Read until the output goes quiet.
+
+    Returns the times of the first and last chunks, the size of the
+    first chunk, and the total size.
+    """
+    first = last = None
+    first_size = size = 0
+    while True:
+        wait = timeout if first is None else settle
+        try:
+            data = await asyncio.wait_for(reader.read(65536), wait)
+        except asyncio.TimeoutError:
+            break
+        now = time.perf_counter()
+        if not data:
+            break
+        if first is None:
+            first = now
+            first_size = len(data)
+        last = now
+        size += len(data)
+    return first, last, first_size, size
+
+
+async def run_caller(host, port, script, settle=0.25, think=0.0, timeout=10.0):
+    """Work through a script as a single caller. Returns a list of _Step results."""
+    steps = []
+    sent = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for name, keys in script:
+            if keys:
+                await asyncio.sleep(think)
+                writer.write(keys)
+                await writer.drain()
+                sent = time.perf_counter()
+
+            first, last, first_size, size = await _read_screen(reader, settle, timeout)
+            if first is None:
+                steps.append(_Step(name, None, None, 0, None))
+                continue
+            # The first chunk was already on its way at `first`, so
+            # only the bytes after it count towards the rate:
+            drawing = last - first
+            bps = (size - first_size) * BITS_PER_BYTE / drawing if drawing > 0 else None
+            steps.append(_Step(name, first - sent, last - sent, size, bps))
+    finally:
+        writer.close()
+    return steps
+
+
+def percentile(values, fraction):
+    """The value at `fraction` (0 to 1) of the way through the sorted values."""
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def _cpu_seconds(pid):
+    """The CPU time used by a process and its children, or None if unknown."""
+    # Linux only. Fields 14 and 15 are user and system time, in clock ticks:
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return None
+    seconds = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return seconds + sum(_cpu_seconds(child) or 0 for child in children)
+
+
+async def run(host, port, clients, script, ramp=1.0, settle=0.25, think=0.0, timeout=10.0):
+    """Run `clients` callers, started evenly over `ramp` seconds.
+
+    Returns a list of results, one per caller: either a list of
+    _Step, or the exception that stopped that caller.
+    """
+    async def caller(number):
+        await asyncio.sleep(ramp * number / clients)
+        return await run_caller(host, port, script, settle, think, timeout)
+
+    return await asyncio.gather(*(caller(number) for number in range(clients)), return_exceptions=True)
+
+
+def _format(value, scale=1000, unit='ms'):
+    return '-' if value is None else f"{value * scale:.1f}{unit}"
+
+
+def report(results, bitrate, elapsed, server_cpu=None, file=sys.stdout):
+    """Print a summary of the results."""
+    failures = [result for result in results if isinstance(result, BaseException)]
+    callers = [result for result in results if not isinstance(result, BaseException)]
+
+    print(f"{len(results)} callers, {len(failures)} failed, in {elapsed:.1f}s", file=file)
+    for exception in {repr(exception) for exception in failures}:
+        print("   ", exception, file=file)
+
+    names = [name for name, _keys in _script]
+    names = [name for name in names if any(step.name == name for steps in callers for step in steps)]
+    header = f"{'step':<12}{'bytes':>7}  {'ttfb p50':>9}{'p90':>9}{'p99':>9}  " \
+             f"{'done p50':>9}{'p90':>9}{'p99':>9}  {'bps p50':>8}{'p10':>8}"
+    print(header, file=file)
+
+    for name in names:
+        steps = [step for result in callers for step in result if step.name == name]
+        ttfb = [step.ttfb for step in steps if step.ttfb is not None]
+        done = [step.completion for step in steps if step.completion is not None]
+        bps = [step.bps for step in steps if step.bps is not None]
+        size = percentile([step.size for step in steps], 0.5)
+        print(f"{name:<12}{size:>7}  "
+              f"{_format(percentile(ttfb, 0.5)):>9}{_format(percentile(ttfb, 0.9)):>9}"
+              f"{_format(percentile(ttfb, 0.99)):>9}  "
+              f"{_format(percentile(done, 0.5)):>9}{_format(percentile(done, 0.9)):>9}"
+              f"{_format(percentile(done, 0.99)):>9}  "
+              f"{_format(percentile(bps, 0.5), 1, ''):>8}{_format(percentile(bps, 0.1), 1, ''):>8}",
+              file=file)
+
+    rates = [step.bps for result in callers for step in result if step.bps is not None and step.size > 100]
+    if rates and bitrate:
+        print(f"Achieved {percentile(rates, 0.5) / bitrate:.0%} of {bitrate} bps "
+              f"(median of screens over 100 bytes)", file=file)
+    if server_cpu is not None and results:
+        print(f"Server CPU: {server_cpu:.3f}s, {server_cpu / len(results) * 1000:.2f}ms per session", file=file)
+
+
+def _spawn_server(port, bitrate, workers):
+    directory = tempfile.mkdtemp(prefix='gibson-loadtest-')
+    start = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'start.py')
+    command = [sys.executable, start, '--addr', '127.0.0.1', '--port', str(port), '--bitrate', str(bitrate),
+               '--database', os.path.join(directory, 'loadtest.db'), '--workers', str(workers)]
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL), directory
+
+
+async def _wait_for_server(host, port, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            _reader, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m gibson.loadtest', description="Load test a Server")
+    parser.add_argument('--host', default='127.0.0.1', help="server address (defaults to 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=6400, help="server port (defaults to 6400)")
+    parser.add_argument('--clients', type=int, default=10, help="number of callers (defaults to 10)")
+    parser.add_argument('--ramp', type=float, default=1.0, help="seconds over which to start the callers")
+    parser.add_argument('--bitrate', type=int, default=9600, help="the server's bitrate (defaults to 9600)")
+    parser.add_argument('--settle', type=float, default=0.25,
+                        help="seconds of quiet that mark a finished screen (defaults to 0.25)")
+    parser.add_argument('--think', type=float, default=0.0, help="seconds to wait before each keystroke")
+    parser.add_argument('--post', action='store_true',
+                        help="post to the wall, even without --spawn")
+    parser.add_argument('--no-post', action='store_true', help="don't post to the wall, even with --spawn")
+    parser.add_argument('--spawn', action='store_true', help="start a server to test, with a scratch database")
+    parser.add_argument('--workers', type=int, default=1, help="worker processes for a spawned server")
+    args = parser.parse_args(argv)
+
+    # Only the scratch database of a spawned server is posted to, unless asked:
+    post = (args.post or args.spawn) and not args.no_post
+
+    process = None
+    if args.spawn:
+        process, directory = _spawn_server(args.port, args.bitrate, args.workers)
+        asyncio.run(_wait_for_server(args.host, args.port))
+
+    try:
+        cpu = _cpu_seconds(process.pid) if process else None
+        started = time.perf_counter()
+        results = asyncio.run(run(args.host, args.port, args.clients, _script if post else _no_post,
+                                  args.ramp, args.settle, args.think))
+        elapsed = time.perf_counter() - started
+        if cpu is not None:
+            cpu = _cpu_seconds(process.pid) - cpu
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    report(results, args.bitrate, elapsed, cpu)
+    print(f"Load generator CPU: {time.process_time():.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Metrics, in the Prometheus text exposition format.
+
+Nothing is counted here on the hot paths. Connections and the Server
+keep plain integer counters, and they are only gathered up into
+`Metric` samples when the endpoint is scraped. The endpoint is a tiny,
+read-only HTTP server that answers ``GET /metrics``, and binds to
+localhost by default.
+"""
+
+import bisect
+import asyncio
+
+
+class Metric:
+    """A named metric, and its samples.
+
+    :Parameters:
+        `name` : str
+            The metric name, such as ``gibson_sessions``.
+        `kind` : str
+            One of 'counter', 'gauge', 'histogram' or 'untyped'.
+        `help` : str
+            A short description.
+    """
+
+    __slots__ = 'name', 'kind', 'help', 'samples'
+
+    def __init__(self, name, kind, help):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.samples = []
+
+    def add(self, value, **labels):
+        """Add a sample, with optional labels. Returns the Metric."""
+        self.samples.append((self.name, labels, value))
+        return self
+
+    def add_histogram(self, histogram, **labels):
+        """Add the samples for a `Histogram`, with optional labels. Returns the Metric."""
+        total = 0
+        for bound, count in zip(histogram.bounds + (float('inf'),), histogram.counts):
+            total += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            self.samples.append((self.name + '_bucket', dict(labels, le=le), total))
+        self.samples.append((self.name + '_sum', labels, histogram.sum))
+        self.samples.append((self.name + '_count', labels, histogram.count))
+        return self
+
+
+class Histogram:
+    """Counts observations into buckets.
+
+    :Parameters:
+        `bounds` : tuple of float
+            The upper bound of each bucket, in increasing order. There
+            is always one more bucket, for anything larger.
+    """
+
+    __slots__ = 'bounds', 'counts', 'sum', 'count'
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class ServerCounters:
+    """Counters kept by a Server, for things that happen less than once per byte."""
+
+    __slots__ = 'accepts', 'disconnects', 'overflows', 'bytes_received', 'bytes_sent', 'bytes_saved', 'screens'
+
+    def __init__(self):
+        self.accepts = 0
+        self.disconnects = 0
+        self.overflows = 0
+        # Totals from connections that have since closed:
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        # Screen name -> number of times it was entered:
+        self.screens = {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render(metrics):
+    """Return the text format for an iterable of Metrics."""
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples:
+            if labels:
+                label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+            else:
+                lines.append(f"{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsEndpoint:
+    """Serves metrics over HTTP.
+
+    :Parameters:
+        `collect` : callable
+            Called for each scrape. Returns an iterable of Metrics.
+        `port` : int
+            The port to listen on.
+        `address` : str
+            The address to listen on.
+    """
+
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, collect, port, address='127.0.0.1'):
+        self._collect = collect
+        self._port = port
+        self._address = address
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self._address, self._port)
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Skip the headers:
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass
+
+            parts = request.decode('latin-1').split()
+            if len(parts) < 2:
+                status, body = '400 Bad Request', "Bad request\n"
+            elif parts[0] != 'GET':
+                status, body = '405 Method Not Allowed', "Only GET is allowed\n"
+            elif parts[1].split('?')[0] not in ('/', '/metrics'):
+                status, body = '404 Not Found', "Not found\n"
+            else:
+                status, body = '200 OK', render(self._collect())
+
+            body = body.encode()
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {self.content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
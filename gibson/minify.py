@@ -0,0 +1,49 @@
+"""Rewrite .seq files, without the PETSCII codes that change nothing.
+
+Each file is passed through the :py:mod:`gibson.peephole` optimizer,
+and only rewritten if the result draws the same screen::
+
+    python -m gibson.minify resources/*.seq
+
+With ``--check``, files are only checked, and the exit status is 1 if
+any of them could be made smaller.
+"""
+
+import sys
+import argparse
+
+from .peephole import optimize, equivalent
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m gibson.minify',
+                                     description="Remove redundant codes from PETSCII .seq files")
+    parser.add_argument('files', nargs='+', help=".seq files to rewrite in place")
+    parser.add_argument('--check', action='store_true', help="report savings, but leave the files alone")
+    args = parser.parse_args(argv)
+
+    status = 0
+    for path in args.files:
+        with open(path, 'rb') as f:
+            original = f.read()
+        optimized = optimize(original)
+        if not equivalent(original, optimized):
+            # A bug here, rather than in the file. Leave it alone:
+            print(f"{path}: not optimized, the result would draw differently", file=sys.stderr)
+            status = 2
+            continue
+
+        saved = len(original) - len(optimized)
+        print(f"{path}: {len(original)} -> {len(optimized)} bytes ({saved} saved)")
+        if not saved:
+            continue
+        if args.check:
+            status = status or 1
+        else:
+            with open(path, 'wb') as f:
+                f.write(optimized)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
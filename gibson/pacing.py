@@ -0,0 +1,107 @@
+"""Outbound rate limiting, to emulate the speed of a modem link.
+
+A single :py:class:`Pacer` is shared by every connection on a Server.
+Each connection owns a small :py:class:`Bucket` of byte credit, which
+is refilled from the monotonic clock at the connection's bit rate.
+When a connection runs out of credit it waits on the Pacer, which runs
+one periodic tick for all waiting connections, no matter how many
+there are.
+"""
+
+import asyncio as _asyncio
+
+
+# Serial links send 8-N-1 frames: a start bit,
+# eight data bits, and a stop bit for each byte:
+BITS_PER_BYTE = 10
+
+
+class Bucket:
+    """Token bucket holding the byte credit for a single connection."""
+
+    __slots__ = 'rate', 'capacity', 'tokens', 'timestamp'
+
+    def __init__(self, bps, capacity, timestamp):
+        self.rate = bps / BITS_PER_BYTE
+        self.capacity = capacity
+        self.tokens = capacity
+        self.timestamp = timestamp
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+
+    def take(self, size):
+        """Take up to `size` whole bytes of credit, returning the amount taken."""
+        size = min(size, int(self.tokens))
+        self.tokens -= size
+        return size
+
+    def charge(self, size):
+        """Take `size` more bytes of credit, for bytes sent beyond what was taken.
+
+        The credit may go below zero. It is then paid back before any
+        more can be taken.
+        """
+        self.tokens -= size
+
+
+class Pacer:
+    """Releases byte credit to many connections from a single timer.
+
+    :Parameters:
+        `interval` : float
+            Seconds between ticks. Smaller values give smoother output,
+            at the cost of waking the event loop more often.
+    """
+
+    def __init__(self, interval=0.02):
+        self._interval = interval
+        self._waiting = {}
+        self._handle = None
+
+    def create_bucket(self, bps):
+        """Create a new Bucket for a connection at the given bit rate."""
+        loop = _asyncio.get_running_loop()
+        # Room for the fraction of a byte left over from the last take,
+        # plus the credit of two ticks, to ride out a late one. Anything
+        # less, and slow links lose credit each tick, and fall short:
+        capacity = 1 + 2 * self._interval * bps / BITS_PER_BYTE
+        return Bucket(bps, capacity, loop.time())
+
+    async def acquire(self, bucket, size):
+        """Wait for credit in the bucket, and take up to `size` bytes of it.
+
+        Returns the number of bytes that may now be sent, which is
+        always at least one.
+        """
+        loop = _asyncio.get_running_loop()
+        bucket.refill(loop.time())
+        if bucket.tokens >= 1:
+            return bucket.take(size)
+
+        future = loop.create_future()
+        self._waiting[bucket] = future, size
+        if self._handle is None:
+            self._handle = loop.call_at(loop.time() + self._interval, self._tick, loop)
+
+        try:
+            return await future
+        finally:
+            self._waiting.pop(bucket, None)
+
+    def _tick(self, loop):
+        now = loop.time()
+
+        for bucket, (future, size) in list(self._waiting.items()):
+            if future.done():
+                continue
+            bucket.refill(now)
+            if bucket.tokens >= 1:
+                future.set_result(bucket.take(size))
+                del self._waiting[bucket]
+
+        if self._waiting:
+            self._handle = loop.call_at(now + self._interval, self._tick, loop)
+        else:
+            self._handle = None
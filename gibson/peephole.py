@@ -0,0 +1,217 @@
+"""A peephole optimizer for PETSCII output.
+
+Hand-drawn .seq files, and output that is assembled from pieces, tend
+to carry codes that change nothing: a colour the pen already has, a
+second REVERSE ON, a cursor move that is undone by the next one. A
+:py:class:`PeepholeOptimizer` follows the terminal's state through a
+stream, and leaves those out:
+
+- Colour and reverse codes are held back until something is printed,
+  and only sent if the pen does not already match. A colour that is
+  replaced before anything is printed in it is never sent at all.
+- Character set codes that select the current set are dropped.
+- A run of cursor moves is replaced with the shortest run of moves
+  that ends up in the same place, if the cursor position is known.
+
+The screen a terminal shows after the optimized stream is the same,
+cell for cell, as after the original, and so are the cursor and pen.
+Moves that scroll the screen are sent as they are, and nothing is
+changed inside quotes or after INSERT, where control codes are printed
+rather than obeyed.
+
+It can run on a connection's output (see
+:py:class:`~gibson.server.AsyncConnection`), or rewrite .seq files
+with :py:mod:`gibson.minify`.
+"""
+
+from .framebuffer import FrameBuffer, UNKNOWN, WIDTH, HEIGHT, _colour_codes, _colours, _printable, _relative
+from .petscii import *
+
+
+_moves = frozenset(CURSOR_UP + CURSOR_DOWN + CURSOR_LEFT + CURSOR_RIGHT + HOME)
+_pen = frozenset(REVERSE_ON + REVERSE_OFF) | frozenset(_colours)
+_forward = frozenset(CURSOR_DOWN + CURSOR_RIGHT)
+_charsets = {LOUP_CHARSET[0]: True, UPGFX_CHARSET[0]: False}
+_line_ends = frozenset(RETURN + SHIFT_RETURN)
+
+
+class PeepholeOptimizer:
+    """Removes redundant codes from a PETSCII stream.
+
+    The whole stream should be passed through `feed`, in order, so that
+    the optimizer can follow the state of the terminal.
+
+    :Parameters:
+        `screen` : `~gibson.framebuffer.FrameBuffer`
+            The state of the terminal when the stream starts. If None,
+            the pen, character set and cursor position are unknown,
+            until the stream sets them. Either way, the terminal is
+            assumed not to be in quote or insert mode.
+    """
+
+    def __init__(self, screen=None):
+        if screen is None:
+            screen = FrameBuffer()
+            screen.invalidate()
+            self._position_known = self._links_known = False
+        else:
+            screen = screen.copy()
+            self._position_known = self._links_known = True
+        # Follows the original stream:
+        self._screen = screen
+        # The pen as it was last sent, which lags behind the stream's:
+        self._colour = screen.colour
+        self._reverse = screen.reverse
+        # Held back until something other than a move is sent:
+        self._moves = bytearray()
+        self._run_start = None
+        # After INSERT, everything is sent as is until the next RETURN:
+        self._verbatim = False
+
+    def feed(self, data):
+        """Return the optimized PETSCII for the next part of the stream.
+
+        The result always leaves the terminal in the same state as
+        `data` would, so it can be sent straight away.
+        """
+        screen = self._screen
+        match = _printable.match
+        out = bytearray()
+        position = 0
+        length = len(data)
+        while position < length:
+            if screen.quote or self._verbatim:
+                # Control codes are printed, not obeyed:
+                code = data[position]
+                position += 1
+                self._send(out, bytes((code,)))
+                if code in _line_ends:
+                    self._new_line()
+                continue
+
+            run = match(data, position)
+            if run:
+                self._send(out, run.group())
+                position = run.end()
+                continue
+
+            code = data[position]
+            position += 1
+            if code in _moves:
+                if code in _forward and (not self._position_known or _scrolls(screen, code)):
+                    # If it scrolls, the new row is filled with the pen colour:
+                    self._send(out, bytes((code,)))
+                    continue
+                if not self._moves:
+                    self._run_start = screen.x, screen.y, self._position_known
+                self._moves.append(code)
+                screen.write(bytes((code,)))
+                if code == HOME[0]:
+                    self._position_known = True
+            elif code in _pen:
+                # Sent when there is something to draw with it:
+                screen.write(bytes((code,)))
+            elif code in _charsets:
+                if screen.lowercase != _charsets[code]:
+                    self._flush_moves(out)
+                    out.append(code)
+                    screen.write(bytes((code,)))
+            else:
+                self._send(out, bytes((code,)))
+                if code == CLEAR[0]:
+                    self._position_known = self._links_known = True
+                elif code in _line_ends:
+                    self._new_line()
+                elif code == INSERT[0]:
+                    self._verbatim = True
+
+        self._sync(out)
+        return bytes(out)
+
+    def _send(self, out, data):
+        # Sends data that depends on, or changes, the pen:
+        self._sync(out)
+        out += data
+        self._screen.write(data)
+        self._colour = self._screen.colour
+        self._reverse = self._screen.reverse
+
+    def _sync(self, out):
+        self._flush_moves(out)
+        screen = self._screen
+        if screen.reverse is not None and screen.reverse != self._reverse:
+            out += REVERSE_ON if screen.reverse else REVERSE_OFF
+            self._reverse = screen.reverse
+        if screen.colour != UNKNOWN and screen.colour != self._colour:
+            out += _colour_codes[screen.colour]
+            self._colour = screen.colour
+
+    def _flush_moves(self, out):
+        moves = self._moves
+        if not moves:
+            return
+        x0, y0, known = self._run_start
+        screen = self._screen
+        x, y = screen.x, screen.y
+        best = bytes(moves)
+        if self._position_known:
+            candidates = [HOME + _relative(0, 0, x, y)]
+            if known:
+                # The same moves as FrameBuffer.plan_move, but not those
+                # that use RETURN, which depend on how lines are linked:
+                distance = (y * WIDTH + x) - (y0 * WIDTH + x0)
+                candidates.append(_relative(x0, y0, x, y))
+                candidates.append(CURSOR_RIGHT * distance if distance > 0 else CURSOR_LEFT * -distance)
+            best = min(candidates + [best], key=len)
+        out += best
+        moves.clear()
+
+    def _new_line(self):
+        # Which row RETURN goes to depends on how lines are linked:
+        if not self._links_known:
+            self._position_known = False
+        if self._verbatim:
+            # Insert mode may have ended earlier, so any codes since could
+            # have been obeyed or printed. Forget what they might have done:
+            self._verbatim = False
+            self._screen.colour = self._colour = UNKNOWN
+            self._position_known = False
+
+
+def _scrolls(screen, code):
+    # Whether a cursor move would scroll the screen up:
+    return screen.y == HEIGHT - 1 and (code == CURSOR_DOWN[0] or code == CURSOR_RIGHT[0] and screen.x == WIDTH - 1)
+
+
+def optimize(data, screen=None):
+    """Return the optimized PETSCII for a whole stream.
+
+    :Parameters:
+        `data` : bytes
+            The PETSCII.
+        `screen` : `~gibson.framebuffer.FrameBuffer`
+            The state of the terminal it is sent to, if known.
+    """
+    return PeepholeOptimizer(screen).feed(data)
+
+
+def equivalent(original, optimized, screen=None):
+    """Return True if both streams leave a terminal in the same state.
+
+    They are compared from `screen`, or from a blank screen and from
+    one that has its cursor, pen and character set already changed.
+    """
+    if screen is None:
+        starts = [FrameBuffer(), FrameBuffer()]
+        starts[1].write(LOUP_CHARSET + LIGHT_BLUE + REVERSE_ON + CURSOR_DOWN * 12 + CURSOR_RIGHT * 20)
+    else:
+        starts = [screen]
+    for start in starts:
+        before = start.copy()
+        before.write(original)
+        after = start.copy()
+        after.write(optimized)
+        if not before.matches(after):
+            return False
+    return True
+
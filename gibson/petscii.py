@@ -1,23 +1,55 @@
 """Helper functions and static PETSCII definitions.
+
+Importing this module also registers table driven PETSCII codecs with
+Python's codecs machinery, for each of the C64's two character sets:
+
+* ``petscii_shifted`` (or just ``petscii``): the lower/upper case set.
+* ``petscii_unshifted``: the upper case and graphics set.
+
+For example::
+
+    "Hello!".encode('petscii')
+    b'\xc8ELLO!'.decode('petscii_shifted')
+
+Characters with no PETSCII equivalent are handled by the usual `errors`
+argument, such as 'strict', 'replace' or 'ignore'.
 """
 
+import codecs
+
 
-def encode_petscii(string):
+def encode_petscii(string, errors='strict', shifted=True):
     """Encode a unicode string to Petscii
 
     :param string: A unicode string of text.
+    :param errors: The codec error policy for unmappable characters.
+    :param shifted: Encode for the lower/upper case character set.
     :return: bytes: A byte array of Petscii characters.
     """
-    return bytes([ascii_to_petscii[ord(character)] for character in string])
+    return codecs.charmap_encode(string, errors, _encoding_maps[shifted])[0]
 
 
-def decode_petscii(bytestring):
+def decode_petscii(bytestring, errors='strict', shifted=True):
     """Decode an array of Petscii bytes to unicode text.
 
     :param bytestring: A byte array containing valid Petscii.
+    :param errors: The codec error policy for undefined bytes.
+    :param shifted: Decode for the lower/upper case character set.
     :return: string: A string of text, converted from Petscii.
     """
-    return "".join([chr(petscii_to_ascii[b]) for b in bytestring])
+    return codecs.charmap_decode(bytestring, errors, _decoding_tables[shifted])[0]
+
+
+def split_keys(bytestring):
+    """Split a byte array into individual keys.
+
+    :param bytestring: A byte array, such as a chunk of received input.
+    :return: iterator: An iterator of single byte `bytes` objects.
+    """
+    return map(_single_bytes.__getitem__, bytestring)
+
+
+_single_bytes = [bytes((b,)) for b in range(256)]
 
 
 unicode_mapping = {
@@ -133,3 +165,120 @@ PURPLE = b"\x9C"
 CURSOR_LEFT = b"\x9D"
 YELLOW = b"\x9E"
 CYAN = b"\x9F"
+
+
+# Codecs:
+
+def _build_decoding_table(shifted):
+    table = ['\ufffe'] * 256
+
+    # Control codes:
+    for code in (*range(0x00, 0x20), *range(0x80, 0xA0)):
+        table[code] = chr(petscii_to_ascii[code])
+
+    # Digits and punctuation are shared with ASCII:
+    for code in range(0x20, 0x5B):
+        table[code] = chr(code)
+    table[0x5B:0x60] = '[£]↑←'
+
+    table[0xA0:0xC0] = '\u00a0▌▄▔▁▏▒▕🮏◤🮇├▗└┐▂┌┴┬┤▎▍🮈🮂🮃▃🭿▖▝┘▘▚'
+    table[0xC0:0xE0] = '─♠🭲🭸🭷🭶🭺🭱🭴╮╰╯🭼╲╱🭽🭾•🭻♥🭰╭╳○♣🭵♦┼🮌│π◥'
+
+    if shifted:
+        table[0x41:0x5B] = 'abcdefghijklmnopqrstuvwxyz'
+        table[0xC1:0xDB] = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+        table[0xA9] = '🮙'
+        table[0xBA] = '✓'
+        table[0xDE] = '🮔'
+        table[0xDF] = '🮘'
+
+    # Both of these ranges repeat other glyphs:
+    table[0x60:0x80] = table[0xC0:0xE0]
+    table[0xE0:0xFF] = table[0xA0:0xBF]
+    table[0xFF] = table[0xDE]
+    return ''.join(table)
+
+
+def _build_encoding_map(decoding_table, shifted):
+    # Prefer the first (canonical) code for glyphs that appear twice:
+    encoding_map = {}
+    for code in (*range(0x00, 0x60), *range(0x80, 0xE0)):
+        char = decoding_table[code]
+        if char != '\ufffe':
+            encoding_map.setdefault(ord(char), code)
+
+    # Heavy box drawing characters are drawn as the light ones:
+    for char, light in zip('━┃┏┓┗┛┣┫┳┻╋', '─│┌┐└┘├┤┬┴┼'):
+        encoding_map[ord(char)] = encoding_map[ord(light)]
+
+    # ASCII punctuation with no PETSCII glyph of its own is encoded
+    # as it always was, as the nearest symbol (for example _ as ←):
+    for char in '\\^_`{|}~':
+        encoding_map.setdefault(ord(char), ascii_to_petscii[ord(char)])
+
+    encoding_map[ord('\r')] = encoding_map[ord('\n')]
+    encoding_map[ord('\t')] = 0x20
+    if not shifted:
+        # There is no lower case, but upper case is better than nothing:
+        for char in 'abcdefghijklmnopqrstuvwxyz':
+            encoding_map[ord(char)] = encoding_map[ord(char.upper())]
+    return encoding_map
+
+
+_decoding_tables = {shifted: _build_decoding_table(shifted) for shifted in (True, False)}
+_encoding_maps = {shifted: _build_encoding_map(_decoding_tables[shifted], shifted) for shifted in (True, False)}
+
+
+class _Codec(codecs.Codec):
+    decoding_table = None
+    encoding_map = None
+
+    def encode(self, input, errors='strict'):
+        return codecs.charmap_encode(input, errors, self.encoding_map)
+
+    def decode(self, input, errors='strict'):
+        return codecs.charmap_decode(input, errors, self.decoding_table)
+
+
+class _IncrementalEncoder(codecs.IncrementalEncoder):
+    encoding_map = None
+
+    def encode(self, input, final=False):
+        return codecs.charmap_encode(input, self.errors, self.encoding_map)[0]
+
+
+class _IncrementalDecoder(codecs.IncrementalDecoder):
+    decoding_table = None
+
+    def decode(self, input, final=False):
+        return codecs.charmap_decode(input, self.errors, self.decoding_table)[0]
+
+
+def _make_codec_info(name, shifted):
+    # PETSCII is a single byte encoding, so the incremental
+    # encoder and decoder need not keep any state between calls.
+    tables = dict(decoding_table=_decoding_tables[shifted], encoding_map=_encoding_maps[shifted])
+    codec = type('Codec', (_Codec,), tables)
+    return codecs.CodecInfo(
+        name=name,
+        encode=codec().encode,
+        decode=codec().decode,
+        incrementalencoder=type('IncrementalEncoder', (_IncrementalEncoder,), tables),
+        incrementaldecoder=type('IncrementalDecoder', (_IncrementalDecoder,), tables),
+        streamreader=type('StreamReader', (codec, codecs.StreamReader), {}),
+        streamwriter=type('StreamWriter', (codec, codecs.StreamWriter), {}),
+    )
+
+
+_codecs = {
+    'petscii': _make_codec_info('petscii_shifted', True),
+    'petscii_shifted': _make_codec_info('petscii_shifted', True),
+    'petscii_unshifted': _make_codec_info('petscii_unshifted', False),
+}
+
+
+def _search(name):
+    return _codecs.get(name.replace('-', '_'))
+
+
+codecs.register(_search)
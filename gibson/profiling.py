@@ -0,0 +1,192 @@
+"""Optional instrumentation, for finding out what is holding up the loop.
+
+`HandlerTimings.install` wraps the Session's key and screen handlers,
+and the `activate`, `handle_keys` and `handle_input` methods of every
+registered screen class, to record how long each call takes. Timings
+are kept in a histogram per screen class and handler. Nothing is
+wrapped until it is installed, so there is no cost otherwise.
+
+`SamplingProfiler` samples the stack of the event loop's thread at a
+fixed interval, for a short window, and writes the samples out in the
+collapsed stack format used by flamegraph.pl, speedscope and others::
+
+    gibson/server.py:on_receive_batch;gibson/screens.py:handle_keys 12
+"""
+
+import os
+import sys
+import time
+import functools
+import threading
+
+from .metrics import Histogram, Metric
+
+
+# Upper bounds of the latency buckets, in seconds:
+_bounds = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+_screen_handlers = ('activate', 'handle_keys', 'handle_input')
+
+
+class HandlerTimings:
+    """Latency histograms, per screen class and handler."""
+
+    def __init__(self):
+        # (screen class name, handler name) -> Histogram:
+        self.histograms = {}
+        self._originals = []
+
+    def observe(self, screen, handler, seconds):
+        key = screen, handler
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(_bounds)
+        histogram.observe(seconds)
+
+    def _wrap_screen_method(self, cls, name):
+        method = _unwrapped(getattr(cls, name))
+        screen = cls.__name__
+
+        @functools.wraps(method)
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return method(*args)
+            finally:
+                self.observe(screen, name, time.perf_counter() - start)
+
+        self._patch(cls, name, timed)
+
+    def _wrap_session_method(self, cls, name):
+        method = _unwrapped(getattr(cls, name))
+
+        @functools.wraps(method)
+        def timed(session, *args):
+            # Labelled with the screen the Session was on when called:
+            current = session.current_screen
+            screen = type(current).__name__ if current is not None else '(none)'
+            start = time.perf_counter()
+            try:
+                return method(session, *args)
+            finally:
+                self.observe(screen, 'Session.' + name, time.perf_counter() - start)
+
+        self._patch(cls, name, timed)
+
+    def _patch(self, cls, name, function):
+        function._timed_original = _unwrapped(getattr(cls, name))
+        # Remember whether the class had its own, or inherited it:
+        self._originals.append((cls, name, cls.__dict__.get(name)))
+        setattr(cls, name, function)
+
+    def install(self, session_class, screen_classes):
+        """Wrap the handlers of the Session class, and each screen class.
+
+        Sessions created before this keep their handlers unwrapped.
+        """
+        if self._originals:
+            return
+        for name in ('on_receive_batch', 'set_screen'):
+            self._wrap_session_method(session_class, name)
+        for cls in screen_classes:
+            for name in _screen_handlers:
+                self._wrap_screen_method(cls, name)
+
+    def uninstall(self):
+        """Restore the original handlers."""
+        for cls, name, original in reversed(self._originals):
+            if original is None:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+        self._originals.clear()
+
+    def collect_metrics(self):
+        """Return a list of :py:class:`~gibson.metrics.Metric`."""
+        metric = Metric('gibson_handler_seconds', 'histogram', "Time spent in each handler, per screen.")
+        for (screen, handler), histogram in sorted(self.histograms.items()):
+            metric.add_histogram(histogram, screen=screen, handler=handler)
+        return [metric]
+
+
+def _unwrapped(function):
+    # So that a subclass wrapped after its parent isn't timed twice:
+    return getattr(function, '_timed_original', function)
+
+
+class SamplingProfiler:
+    """Samples the stack of a thread, from a background thread.
+
+    :Parameters:
+        `interval` : float
+            Seconds between samples.
+        `thread_id` : int
+            The thread to sample. Defaults to the calling thread.
+    """
+
+    def __init__(self, interval=0.001, thread_id=None):
+        self.interval = interval
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        # Collapsed stack -> number of samples:
+        self.stacks = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration=None, filename=None):
+        """Start sampling.
+
+        If `duration` is given, sampling stops after that many seconds,
+        and the samples are written to `filename`, if given.
+        """
+        self.stacks.clear()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(duration, filename),
+                                        name='SamplingProfiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling, and wait for the sampling thread to finish."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def _run(self, duration, filename):
+        deadline = None if duration is None else time.perf_counter() + duration
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = self._collapse(frame)
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        if filename is not None:
+            self.write(filename)
+
+    @staticmethod
+    def _collapse(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{_short_path(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def write(self, filename):
+        """Write the samples, one collapsed stack and count per line."""
+        with open(filename, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+
+@functools.lru_cache(maxsize=None)
+def _short_path(filename):
+    # Trim everything up to the package, or the standard library:
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
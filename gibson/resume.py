@@ -0,0 +1,142 @@
+"""Parking Sessions, so callers whose line drops can pick up where they were.
+
+Modem links drop often, and a new Session starts from the splash
+screen, which is a lot to send again at 1200 bps. When a caller's
+connection drops, their Session is parked instead of closed: it keeps
+its display, screen and screen state, such as a half-written wall
+entry, but lets go of the connection and stops listening for updates.
+If the same caller connects again within `ttl` seconds, the Session is
+taken back out, and brought up to date with a single redraw. See
+:py:meth:`gibson.server.Session.resume`.
+
+Each Session has a short `resume code`, which the main menu shows the
+caller. A parked Session is only handed back to a caller from the same
+remote host who types the same code, so another caller behind the same
+address can't pick it up. After `max_attempts` wrong codes, the Session
+is closed. Only the latest Session from each host is kept, and only
+from screens that are `resumable`: there is nothing to resume on the
+splash screen.
+
+Like the :py:class:`~gibson.admission.IdleReaper`, the store uses a
+single timer for the earliest deadline. Every Session is parked for the
+same time, so insertion order is deadline order, and no heap is needed.
+"""
+
+import hmac
+import secrets
+import asyncio
+import collections
+
+
+# Resume codes are typed on a C64, so they leave out 0/O and 1/I:
+RESUME_CODE_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+RESUME_CODE_LENGTH = 5
+
+
+def new_resume_code():
+    """Return a new random resume code."""
+    return ''.join(secrets.choice(RESUME_CODE_ALPHABET) for _ in range(RESUME_CODE_LENGTH))
+
+
+class ParkedSessions:
+    """A bounded store of parked Sessions, each kept for `ttl` seconds.
+
+    Sessions that expire, are replaced, are pushed out by the
+    `capacity`, or have their code guessed wrong too often, are closed.
+
+    :Parameters:
+        `ttl` : float
+            Seconds a Session is kept for.
+        `capacity` : int
+            The most Sessions kept at once. The oldest goes first.
+        `max_attempts` : int
+            Wrong resume codes allowed for a Session, before it is
+            closed.
+    """
+
+    def __init__(self, ttl, capacity=64, max_attempts=3):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.max_attempts = max_attempts
+        self.resumed = 0
+        self.expired = 0
+        self.refused = 0
+        # Remote host -> (deadline, Session), oldest first:
+        self._parked = collections.OrderedDict()
+        # Remote host -> wrong codes so far:
+        self._attempts = {}
+        self._timer = None
+        self._loop = asyncio.get_event_loop()
+
+    def __len__(self):
+        return len(self._parked)
+
+    def __contains__(self, caller):
+        return caller in self._parked
+
+    def park(self, caller, session):
+        """Keep a Session, which must already have been parked, for `caller`."""
+        self._discard(caller)
+        while len(self._parked) >= self.capacity:
+            self.expired += 1
+            self._discard(next(iter(self._parked)))
+
+        self._parked[caller] = self._loop.time() + self.ttl, session
+        if self._timer is None:
+            self._schedule()
+
+    def take(self, caller, code):
+        """Return the Session parked for `caller`, and forget it.
+
+        Returns None if there is none, or if `code` is not its resume
+        code.
+        """
+        parked = self._parked.get(caller)
+        if parked is None:
+            return None
+        session = parked[1]
+        if not hmac.compare_digest(code.encode(), session.resume_code.encode()):
+            self.refused += 1
+            attempts = self._attempts[caller] = self._attempts.get(caller, 0) + 1
+            if attempts >= self.max_attempts:
+                self._discard(caller)
+            return None
+
+        del self._parked[caller]
+        self._attempts.pop(caller, None)
+        self.resumed += 1
+        if not self._parked and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return session
+
+    def close(self):
+        """Close every parked Session."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._parked:
+            self._discard(next(iter(self._parked)))
+
+    def _discard(self, caller):
+        self._attempts.pop(caller, None)
+        parked = self._parked.pop(caller, None)
+        if parked is not None:
+            parked[1].close()
+
+    def _schedule(self):
+        deadline, _session = next(iter(self._parked.values()))
+        self._timer = self._loop.call_at(deadline, self._expire)
+
+    def _expire(self):
+        self._timer = None
+        now = self._loop.time()
+        parked = self._parked
+        while parked:
+            caller, (deadline, _session) = next(iter(parked.items()))
+            if deadline > now:
+                break
+            self.expired += 1
+            self._discard(caller)
+        if parked:
+            self._schedule()
@@ -1,211 +1,453 @@
 import time
-
-from datetime import datetime
+import asyncio
 
 from .petscii import *
+from .resume import RESUME_CODE_ALPHABET, RESUME_CODE_LENGTH
+from .templates import compile_template
 
 
 class _Screen:
+    """Base class for screens.
 
-    echo = False
-    session = None
-    cursor_x = 0
-    cursor_y = 0
+    Screens hold no per-caller state, so a single instance of each is
+    shared by every Session (see `get_screen`). The Session is passed in
+    to each method instead. Screens that need to remember something
+    between keys can set `state_class`, and the Session will create a
+    fresh instance of it as `session.screen_state` each time the
+    screen is entered.
 
-    @property
-    def connection(self):
-        return self.session.connection
+    Screens that look the same for every caller can implement `draw`,
+    and call `show_template` from `activate`. What `draw` sends is then
+    compiled into a :py:class:`~gibson.templates.Template` once, and
+    shared. Fields that change go in `slots`, and are filled in by
+    `show_template`.
+    """
 
-    def send(self, message):
-        # TODO: handle cursor offsets
-        for b in message:
-            self.connection.send(bytes([b]))
+    state_class = None
 
-    def send_unicode(self, string, color=b''):
-        # TODO: replace invalid characters
-        byte_string = bytes((color + bytes([ord(s) for s in string]).swapcase()))
-        self.connection.send(byte_string)
+    # Whether a Session on this screen is worth parking, if the line drops:
+    resumable = True
 
-        self.cursor_x = self.cursor_x + len(string) % 40    # horizontal wrap position
-        self.cursor_y += (self.cursor_x + len(string)) // 40  # vertical offset position
+    # Slot name -> (column, row, width, colour), for `show_template`:
+    slots = {}
 
-    def activate(self):
-        raise NotImplementedError
+    # Codec error policy for characters with no PETSCII equivalent:
+    errors = 'replace'
+
+    def __init__(self):
+        # lowercase -> (assets, generation, Template):
+        self._templates = {}
+
+    def create_state(self):
+        return self.state_class() if self.state_class else None
+
+    def send(self, session, message):
+        # Drawn on the Session's display. Only the
+        # changes are sent when the Session flushes.
+        session.display.write(message)
 
-    def handle_input(self, character):
+    def send_unicode(self, session, string, color=b''):
+        # Encode for whichever character set the screen is showing:
+        shifted = bool(session.display.lowercase)
+        session.display.write(color + encode_petscii(string, self.errors, shifted))
+
+    def activate(self, session):
         raise NotImplementedError
 
-    def _reset(self):
-        self.send(WHITE)
-        self.send(CLEAR)
-        self._go_home()
+    def draw(self, session):
+        """Draw the parts of the screen that are the same for every caller."""
+        raise NotImplementedError
 
-    def _go_home(self):
-        self.send(HOME)
-        self.cursor_x = 0
-        self.cursor_y = 0
+    def show_template(self, session, **values):
+        """Show what `draw` draws, with the slots filled in from `values`.
+
+        It is drawn once for each character set, and again if the
+        assets are repacked.
+        """
+        assets = session.server.assets
+        generation = assets.generation
+        lowercase = session.display.lowercase
+        cached = self._templates.get(lowercase)
+        if cached is None or cached[0] is not assets or cached[1] != generation:
+            template = compile_template(self.draw, session.server, lowercase, self.slots)
+            cached = self._templates[lowercase] = assets, generation, template
+        cached[2].show(session.display, **values)
+
+    def deactivate(self, session):
+        """Called when the Session leaves the screen, closes, or is parked."""
+        pass
+
+    def resume(self, session):
+        """Called when a parked Session carries on, on a new connection.
+
+        Whatever `deactivate` let go of should be picked up again. The
+        display is as the caller left it, and is sent once this returns.
+        """
+        pass
+
+    def handle_input(self, session, character):
+        raise NotImplementedError
 
-    def _go_to(self, column, row):
-        x_diff = column - self.cursor_x
-        y_diff = row - self.cursor_y
+    def handle_keys(self, session, keys):
+        """Handle a batch of received keys.
 
-        cmd_bytestring = b""
+        By default each key is passed to `handle_input` in turn. This
+        stops early if a key causes the Session to change screens.
+        Returns the number of keys that were consumed.
+        """
+        for count, key in enumerate(split_keys(keys), 1):
+            self.handle_input(session, key)
+            if session.current_screen is not self:
+                return count
+        return len(keys)
 
-        if x_diff < 0:
-            cmd_bytestring = CURSOR_LEFT * abs(x_diff)
-        elif x_diff > 0:
-            cmd_bytestring = CURSOR_RIGHT * x_diff
+    def _reset(self, session):
+        self.send(session, WHITE + CLEAR + HOME)
 
-        if y_diff < 0:
-            cmd_bytestring += CURSOR_UP * abs(y_diff)
-        elif y_diff > 0:
-            cmd_bytestring += CURSOR_DOWN * y_diff
+    def _go_home(self, session):
+        self.send(session, HOME)
 
-        self.send(cmd_bytestring)
-        self.cursor_x, self.cursor_y = column, row
+    def _go_to(self, session, column, row):
+        self.send(session, session.display.plan_move(column, row))
 
 
 class SplashScreen(_Screen):
-    def activate(self):
-        self._go_home()
-        self.send_unicode("Smash that DEL key!", color=WHITE)
+    resumable = False
 
-    def handle_input(self, character):
-        self.send(REVERSE_OFF)
-        self._reset()
+    def draw(self, session):
+        self._go_home(session)
+        self.send_unicode(session, "Smash that DEL key!", color=WHITE)
+
+    def activate(self, session):
+        self.show_template(session)
+
+    def handle_input(self, session, character):
+        self.send(session, REVERSE_OFF)
+        self._reset(session)
         if character == DELETE:
-            self.session.set_screen('login')
+            session.set_screen('login')
         else:
-            self.send_unicode("Sorry, Commodore only :(", color=RED)
-            # self.connection.close()
+            self.send_unicode(session, "Sorry, Commodore only :(", color=RED)
+            # session.connection.close()
 
 
 class LoginScreen(_Screen):
-    def activate(self):
-        self._reset()
+    resumable = False
+
+    def activate(self, session):
+        self.show_template(session)
 
-        with open('resources/weather.seq', 'rb') as f:
-            self.send(f.read())
+    def draw(self, session):
+        self._reset(session)
 
-        # self._go_to(column=15, row=2)
-        # self.send_unicode("  Log In  ", CYAN)
+        self.send(session, session.server.assets['weather.seq'])
+
+        # self._go_to(session, column=15, row=2)
+        # self.send_unicode(session, "  Log In  ", CYAN)
         #
-        # self._go_to(column=4, row=6)
-        # self.send_unicode("[E] Existing Account", LIGHT_GREEN)
-        # self._go_to(column=4, row=7)
-        # self.send_unicode("[N] New Account", LIGHT_GREEN)
-        # self._go_to(column=4, row=8)
-        # self.send_unicode("[Q] Log off", PINK)
+        # self._go_to(session, column=4, row=6)
+        # self.send_unicode(session, "[E] Existing Account", LIGHT_GREEN)
+        # self._go_to(session, column=4, row=7)
+        # self.send_unicode(session, "[N] New Account", LIGHT_GREEN)
+        # self._go_to(session, column=4, row=8)
+        # self.send_unicode(session, "[Q] Log off", PINK)
         #
-        # self._go_to(2, 24)
-        # self.send_unicode(">", color=YELLOW)
+        # self._go_to(session, 2, 24)
+        # self.send_unicode(session, ">", color=YELLOW)
 
-    def handle_input(self, character):
-        self.session.set_screen('mainmenu')
+    def handle_input(self, session, character):
+        session.set_screen('mainmenu')
 
 
 class MainMenuScreen(_Screen):
 
-    def activate(self):
-        self._reset()
+    slots = {
+        'posts': (22, 7, 16, GREY),
+        'online': (4, 19, 20, GREY),
+        'date': (29, 22, 9, GREY),
+        'resume': (4, 17, 20, GREY),
+    }
+
+    def activate(self, session):
+        server = session.server
+        online = len(server.online)
+        # For calling back, if the line drops:
+        resume = f"Resume code: {session.resume_code}" if server.parked is not None else ''
+        self.show_template(session, posts=f"({len(server.wall)} posts)",
+                           online=f"{online} caller{'' if online == 1 else 's'} online",
+                           date=time.strftime('%y-%b-%d'), resume=resume)
+
+    def draw(self, session):
+        self._reset(session)
 
-        with open('resources/mainmenu.seq', 'rb') as f:
-            self.send(f.read())
-            self._go_home()
+        self.send(session, session.server.assets['mainmenu.seq'])
+        self._go_home(session)
 
-        self._go_to(column=15, row=2)
-        self.send_unicode("Main  Menu", CYAN)
+        self._go_to(session, column=15, row=2)
+        self.send_unicode(session, "Main  Menu", CYAN)
 
-        self._go_to(column=4, row=7)
-        self.send_unicode("[V] View the Wall", LIGHT_GREEN)
-        self._go_to(column=4, row=8)
-        self.send_unicode("[R] Refresh", LIGHT_GREEN)
-        self._go_to(column=4, row=21)
-        self.send_unicode("[Q] Log off", PINK)
+        self._go_to(session, column=4, row=7)
+        self.send_unicode(session, "[V] View the Wall", LIGHT_GREEN)
+        self._go_to(session, column=4, row=8)
+        self.send_unicode(session, "[R] Refresh", LIGHT_GREEN)
+        self._go_to(session, column=4, row=21)
+        self.send_unicode(session, "[Q] Log off", PINK)
 
-        self._go_to(2, 24)
-        self.send_unicode(">", color=YELLOW)
+        self._go_to(session, 2, 24)
+        self.send_unicode(session, ">", color=YELLOW)
 
-    def handle_input(self, character):
+    def handle_input(self, session, character):
 
         if character == b'R':
-            self.activate()
+            self.activate(session)
 
         elif character == b'Q':
-            self.connection.close()
+            session.connection.close()
 
         elif character == b'V':
-            self.session.set_screen('wall')
+            session.set_screen('wall')
+
+
+class _WallState:
+    __slots__ = 'echo', 'in_entry', 'buffer', 'page', 'listener'
+
+    def __init__(self):
+        self.echo = False
+        self.in_entry = False
+        self.buffer = b''
+        self.page = 0
+        self.listener = None
 
 
 class WallScreen(_Screen):
 
-    entries = [GREEN + b"21-jAN-01> " + LIGHT_BLUE + b"This is a fantastic BBS!".swapcase(),
-               GREEN + b"21-jAN-15> " + LIGHT_BLUE + b"Wooo, what a great BBS. The best around!".swapcase()]
+    state_class = _WallState
 
     def __init__(self):
-        self._in_entry = False
-        self._buffer = b''
-        self._returns = 0
+        super().__init__()
+        # Session -> screen state, for viewers to redraw with new entries:
+        self._changed = {}
+
+    def activate(self, session):
+        self._listen(session)
+        self._draw_page(session)
+
+    def deactivate(self, session):
+        session.server.unsubscribe('wall', session.screen_state.listener)
+
+    def resume(self, session):
+        self._listen(session)
+        # Entries may have been posted while the caller was away:
+        if not session.screen_state.in_entry:
+            self._draw_page(session)
+
+    def _listen(self, session):
+        # New entries, from any caller, are shown as they are posted:
+        state = session.screen_state
+        state.listener = lambda number: self._wall_changed(session, state)
+        session.server.subscribe('wall', state.listener)
+
+    def _wall_changed(self, session, state):
+        # Viewers are redrawn together, once every entry
+        # posted in this iteration of the loop is in:
+        if not self._changed:
+            asyncio.get_event_loop().call_soon(self._redraw_changed)
+        self._changed[session] = state
+
+    def _redraw_changed(self):
+        # Everyone on the same page is shown the same screen. It is drawn
+        # once, and each diff is only rendered for the first viewer whose
+        # screen it starts from. Not while writing an entry:
+        changed, self._changed = self._changed, {}
+        frames = {}
+        renders = {}
+        for session, state in changed.items():
+            if session.screen_state is not state or state.in_entry:
+                continue
+            display = session.display
+            # The pen and quote mode carry over into the new screen:
+            key = state.page, display.lowercase, display.reverse, display.quote
+            scrolls = display.scrolls
+            if key in frames:
+                frame, scrolled = frames[key]
+                display.assign(frame)
+                display.scrolls = scrolls + scrolled
+            elif self._draw_page(session):
+                frames[key] = display.copy(), display.scrolls - scrolls
+            session.flush(renders=renders.setdefault(key, []))
+
+    def _draw_page(self, session, rendered=None):
+        wall = session.server.wall
+        state = session.screen_state
+        state.page = min(state.page, wall.page_count - 1)
+        shifted = bool(session.display.lowercase)
+
+        # Only the page that fits on screen is drawn:
+        self._reset(session)
+        if rendered is None:
+            rendered = wall.get_page(state.page, shifted)
+        if rendered is None:
+            # Older pages come from the archive. Draw the rest now, and
+            # the whole screen again once the page has been loaded:
+            page = state.page
+            session.when_done(wall.load_page(page, shifted),
+                              lambda rendered: self._page_loaded(session, state, page, rendered))
+        else:
+            self.send(session, rendered)
 
-    @staticmethod
-    def _get_timestamp():
-        return f"{datetime.now().strftime('%y-%b-%d')}> ".swapcase().encode()
+        self._go_to(session, 1, 21)
+        self.send_unicode(session, f"Page {state.page + 1} of {wall.page_count}", GREY)
+        self.send_unicode(session, "  [+] Older  [-] Newer", LIGHT_GREEN)
 
-    def activate(self):
-        self._reset()
+        self._go_to(session, 1, 23)
+        self.send_unicode(session, "Write an entry? [y/N]", PINK)
+        self.send_unicode(session, ">", color=YELLOW)
+        # False if the page is still to come:
+        return rendered is not None
 
-        # Write the existing entries:
-        for entry in self.entries:
-            self.send(entry)
-            self.send(RETURN * 2)
-        self._go_home()
+    def _page_loaded(self, session, state, page, rendered):
+        # Unless the caller has moved on in the meantime:
+        if session.screen_state is state and state.page == page and not state.in_entry:
+            self._draw_page(session, rendered)
 
-        self._go_to(1, 23)
-        self.send_unicode("Write an entry? [y/N]", PINK)
-        self.send_unicode(">", color=YELLOW)
+    def handle_input(self, session, character):
+        state = session.screen_state
 
-    def handle_input(self, character):
-        if self.echo:
-            self.send(character)
+        if state.echo:
+            self.send(session, character)
 
-        if not self._in_entry:
+        if not state.in_entry:
 
             if character == b'Y':
                 # Print the Instructions:
-                self.echo = True
-                self._in_entry = True
+                state.echo = True
+                state.in_entry = True
 
-                self.send(CURSOR_RIGHT + character + RETURN * 2)
-                self.send_unicode("Maximum of 80 characters.\r", PINK)
-                self.send_unicode("Hit RETURN twice when finished.", PINK)
-                self.send(RETURN * 2 + CURSOR_RIGHT * 2)
-                self.send_unicode(">", color=YELLOW)
+                self.send(session, CURSOR_RIGHT + character + RETURN * 2)
+                self.send_unicode(session, "Maximum of 80 characters.\r", PINK)
+                self.send_unicode(session, "Hit RETURN twice when finished.", PINK)
+                self.send(session, RETURN * 2 + CURSOR_RIGHT * 2)
+                self.send_unicode(session, ">", color=YELLOW)
 
             elif character in (b'N', b'\r'):
                 # Just return to the main menu:
-                self.session.set_screen('mainmenu')
+                session.set_screen('mainmenu')
+
+            elif character == b'+' and state.page < session.server.wall.page_count - 1:
+                state.page += 1
+                self._draw_page(session)
 
-        elif self._in_entry:
+            elif character == b'-' and state.page > 0:
+                state.page -= 1
+                self._draw_page(session)
+
+        elif state.in_entry:
 
             # Backspace character:
-            if character == b'\x14' and len(self._buffer) > 1:
-                self._buffer = self._buffer[:-1]
+            if character == DELETE:
+                state.buffer = state.buffer[:-1]
 
             # Only add to the buffer if it's < 80 characters:
-            if len(self._buffer) < 80 or character == RETURN:
-                self._buffer += character
+            elif len(state.buffer) < 80 or character == RETURN:
+                state.buffer += character
 
             # Return has been entered twice. Save and return:
-            if len(self._buffer) > 2 and self._buffer[-2:] == RETURN + RETURN:
-                print(self._buffer, self._buffer[-2:])
-                if len(self._buffer) > 2:
-                    self.entries.append(GREEN + self._get_timestamp() + LIGHT_BLUE + self._buffer[:-1])
+            if state.buffer[-2:] == RETURN + RETURN:
+                text = state.buffer.rstrip(RETURN)
 
                 # Reset options before returning:
-                self._buffer = b''
-                self._in_entry = False
-                self.echo = False
-                self._returns = 0
-                self.send_unicode("Saved!", PINK)
-                self.send_unicode("[OK]", color=YELLOW)
+                state.buffer = b''
+                state.in_entry = False
+                state.echo = False
+
+                if text:
+                    saved = session.server.wall.post(decode_petscii(text, 'replace', bool(session.display.lowercase)))
+                    session.when_done(saved, lambda _result: self._saved(session, state),
+                                      lambda _exception: self._saved(session, state, "Not saved!"))
+                else:
+                    self._saved(session, state)
+
+    def _saved(self, session, state, message="Saved!"):
+        if session.screen_state is state and not state.in_entry:
+            self.send_unicode(session, message, PINK)
+            self.send_unicode(session, "[OK]", color=YELLOW)
+
+
+class _ResumeState:
+    __slots__ = 'code',
+
+    def __init__(self):
+        self.code = ''
+
+
+class ResumeScreen(_Screen):
+    """Shown first to callers from a host with a parked Session.
+
+    Typing that Session's resume code picks it up again. Anything else
+    carries on to the splash screen.
+    """
+
+    state_class = _ResumeState
+    resumable = False
+
+    def activate(self, session):
+        self._reset(session)
+        self._go_to(session, 2, 9)
+        self.send_unicode(session, "Welcome back!", YELLOW)
+        self._go_to(session, 2, 11)
+        self.send_unicode(session, "Type your resume code, or just", LIGHT_GREEN)
+        self._go_to(session, 2, 12)
+        self.send_unicode(session, "RETURN to start over.", LIGHT_GREEN)
+        self._go_to(session, 2, 14)
+        self.send_unicode(session, ">", color=YELLOW)
+
+    def handle_input(self, session, character):
+        state = session.screen_state
+
+        if character == RETURN:
+            if not (state.code and session.server.resume_session(session, state.code)):
+                session.set_screen('splash')
+
+        elif character == DELETE:
+            if state.code:
+                state.code = state.code[:-1]
+                self.send(session, DELETE)
+
+        elif len(state.code) < RESUME_CODE_LENGTH:
+            char = decode_petscii(character, 'replace', bool(session.display.lowercase)).upper()
+            if char in RESUME_CODE_ALPHABET:
+                state.code += char
+                self.send_unicode(session, char, WHITE)
+
+
+_screen_classes = {}
+_screen_instances = {}
+
+
+def register_screen(name, screen_class):
+    """Register a screen class under a name, for use with `Session.set_screen`."""
+    _screen_classes[name] = screen_class
+    _screen_instances.pop(name, None)
+
+
+def get_screen_classes():
+    """Return a dict of the registered screen classes, by name."""
+    return dict(_screen_classes)
+
+
+def get_screen(name):
+    """Get the shared instance of a screen, creating it on first use.
+
+    Returns None if no screen is registered under the name.
+    """
+    screen = _screen_instances.get(name)
+    if screen is None and name in _screen_classes:
+        screen = _screen_instances[name] = _screen_classes[name]()
+    return screen
+
+
+register_screen('splash', SplashScreen)
+register_screen('login', LoginScreen)
+register_screen('mainmenu', MainMenuScreen)
+register_screen('wall', WallScreen)
+register_screen('resume', ResumeScreen)
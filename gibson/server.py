@@ -1,148 +1,1060 @@
-import weakref
+import os as _os
+import sys as _sys
+import time as _time
+import signal as _signal
+import shutil as _shutil
 import asyncio as _asyncio
+import tempfile as _tempfile
+import multiprocessing as _multiprocessing
 
+from gibson.admission import AdmissionControl as _AdmissionControl
+from gibson.admission import IdleReaper as _IdleReaper
+from gibson.admission import render_busy_screen as _render_busy_screen
+from gibson.assets import AssetBundle as _AssetBundle
+from gibson.broker import Broker as _Broker
+from gibson.broker import BrokerClient as _BrokerClient
+from gibson.broker import BrokerError as _BrokerError
+from gibson.broker import SharedWall as _SharedWall
+from gibson.bulletin import Bulletin as _Bulletin
+from gibson.database import Database as _Database
 from gibson.event import EventDispatcher as _EventDispatcher
+from gibson.event import EVENT_HANDLED as _EVENT_HANDLED
+from gibson.framebuffer import FrameBuffer as _FrameBuffer
+from gibson.metrics import Metric as _Metric
+from gibson.metrics import MetricsEndpoint as _MetricsEndpoint
+from gibson.metrics import ServerCounters as _ServerCounters
+from gibson.pacing import BITS_PER_BYTE as _BITS_PER_BYTE
+from gibson.pacing import Pacer as _Pacer
+from gibson.peephole import PeepholeOptimizer as _PeepholeOptimizer
+from gibson.profiling import HandlerTimings as _HandlerTimings
+from gibson.profiling import SamplingProfiler as _SamplingProfiler
+from gibson.resume import ParkedSessions as _ParkedSessions
+from gibson.resume import new_resume_code as _new_resume_code
+from gibson.storage import AsyncDatabase as _AsyncDatabase
+from gibson.telnet import TelnetFilter as _TelnetFilter
+from gibson.telnet import escape_iac as _escape_iac
+from gibson.wall import Wall as _Wall
 from gibson.screens import *
 
 
-_baud_bps_map = {
-    300: 60 / 300 / 8,
-    2400: 60 / 2400 / 8,
-    9600: 60 / 9600 / 8,
-}
+# Maximum number of bytes to take from the socket in one read:
+_READ_SIZE = 4096
+
+_default_resources = _os.path.join(_os.path.dirname(_os.path.dirname(_os.path.abspath(__file__))), 'resources')
+
+# Outbound buffer sizes, in bytes (high water, low water, limit):
+_send_buffer = 4096, 1024, 32768
+
+_overflow_policies = 'drop', 'coalesce', 'disconnect'
+
+# The most renders kept for Sessions to share, in one go:
+_shared_renders = 8
+
+# Seconds to spend sending the "all lines busy" screen, before hanging up:
+_busy_timeout = 5.0
 
 
 class AsyncConnection(_EventDispatcher):
+    """A caller's connection.
+
+    Output is buffered, and paced out at `bps`. Once more than the high
+    water mark is waiting, the connection is paused: `writable` is
+    False, and `on_pause_writing` is dispatched. It resumes, with
+    `on_resume_writing`, once the buffer drains to the low water mark.
+
+    Output that would take the buffer past its limit is handled by the
+    overflow `policy`:
+
+        'drop'
+            The new output is discarded.
+        'coalesce'
+            Everything waiting is discarded along with it, so that the
+            owner can replace it all with a single redraw.
+        'disconnect'
+            The connection is closed.
+
+    Unless the connection was closed, `on_overflow` is then dispatched.
 
-    def __init__(self, reader, writer, bps):
+    There are two lanes of output. Interactive output, from `send`, is
+    always sent ahead of bulk output, from `send_bulk`. Bulk output that
+    has not been sent yet can be withdrawn with `cancel_bulk`. Senders
+    that need the two in order should cancel the bulk output before
+    sending anything interactive, as the Session does.
+
+    With `optimize`, output is passed through a
+    :py:class:`~gibson.peephole.PeepholeOptimizer` as it is written, in
+    the order it goes out on the wire.
+
+    With `telnet`, the connection speaks Telnet, through a
+    :py:class:`~gibson.telnet.TelnetFilter`. Commands are stripped from
+    the input before it is dispatched, and output is escaped as it is
+    written, so neither the events nor the buffer sizes include them.
+    """
+
+    def __init__(self, reader, writer, bps, pacer, send_buffer=_send_buffer, policy='coalesce',
+                 optimize=False, telnet=False):
         self._reader = reader
         self._writer = writer
 
-        # Outbound rate limiting.  Convert
-        # bits per second to a delay in seconds:
-        self._delay = 60 / bps / 8
+        host, port = writer.get_extra_info('peername')[:2]
+        self.host = host
+        self.address = f"{host}:{port}"
+
+        # Outbound rate limiting:
+        self.bps = bps
+        self._pacer = pacer
+        self._bucket = pacer.create_bucket(bps)
+
+        # Metrics. Counted per read and per write, not per byte:
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self._send_time = 0.0
+        self._busy_since = None
 
-        self._next_send = time.time()
+        # Pending output is merged here and written out by a single
+        # writer task, rather than scheduling a coroutine per send:
+        self._outbox = bytearray()
+        self._bulk = bytearray()
+        self._pending = _asyncio.Event()
+
+        # Backpressure:
+        if policy not in _overflow_policies:
+            raise ValueError(f"Unknown overflow policy: {policy!r}")
+        self._high_water, self._low_water, self._limit = send_buffer
+        self._policy = policy
+        self._writable = _asyncio.Event()
+        self._writable.set()
+        self.paused = False
+        self.overflows = 0
+        self.dropped_bytes = 0
+
+        self._optimizer = _PeepholeOptimizer() if optimize else None
+        self._telnet = None
+        if telnet:
+            # Negotiation replies are small, and go out unpaced:
+            self._telnet = _TelnetFilter(writer.write)
+            self._telnet.negotiate()
 
         self._closed = False
+        # Set if the caller's end closed, rather than this one:
+        self.dropped = False
         self._loop = _asyncio.get_event_loop()
-        _asyncio.run_coroutine_threadsafe(self._recv(), self._loop)
+        # For the idle reaper, on the loop's clock:
+        self.last_received = self._loop.time()
+        self._recv_task = self._loop.create_task(self._recv())
+        self._send_task = self._loop.create_task(self._send())
 
     def close(self):
         if not self._closed:
             self._writer.transport.close()
             self._closed = True
+            self._outbox.clear()
+            self._bulk.clear()
+            self._writable.set()
+            self._send_task.cancel()
             self.dispatch_event('on_disconnect', self)
 
     async def _recv(self):
         while not self._closed:
             try:
-                message = await self._reader.readexactly(1)
-                self._loop.call_soon(self.dispatch_event, 'on_receive', message)
+                message = await self._reader.read(_READ_SIZE)
+            except ConnectionError:
+                message = b''
 
-            except _asyncio.IncompleteReadError:
+            if not message:
+                self.dropped = True
                 self.close()
                 break
 
-    async def _send(self, message):
-        try:
-            now = time.time()
-            delay = max(0.0, self._next_send - now)
-            self._next_send = max(self._next_send + self._delay, now + delay)
-
-            await _asyncio.sleep(delay)
-            await self._writer.write(message)
-            await self._writer.drain()
-        except ConnectionResetError:
+            self.bytes_received += len(message)
+            self.last_received = self._loop.time()
+            if self._telnet is not None:
+                message = self._telnet.receive(message)
+                if not message:
+                    continue
+            self._loop.call_soon(self.dispatch_event, 'on_receive_batch', message)
+
+    async def _send(self):
+        while not self._closed:
+            await self._pending.wait()
+            self._pending.clear()
+
+            self._busy_since = self._loop.time()
+            try:
+                while (self._outbox or self._bulk) and not self._closed:
+                    size = await self._pacer.acquire(self._bucket, len(self._outbox) + len(self._bulk))
+                    # Interactive output first. Either may have been
+                    # cut short while waiting:
+                    message = bytes(self._outbox[:size])
+                    del self._outbox[:size]
+                    if len(message) < size and self._bulk:
+                        remainder = size - len(message)
+                        message += self._bulk[:remainder]
+                        del self._bulk[:remainder]
+                    if self._optimizer is not None:
+                        optimized = self._optimizer.feed(message)
+                        self.bytes_saved += len(message) - len(optimized)
+                        message = optimized
+                    if not message:
+                        continue
+                    if self._telnet is not None:
+                        # Escaping adds bytes, which are paced as well:
+                        escaped = self._telnet.escape(message)
+                        self._bucket.charge(len(escaped) - len(message))
+                        message = escaped
+
+                    self._writer.write(message)
+                    self.bytes_sent += len(message)
+                    if self.paused and self.outbox_size <= self._low_water:
+                        self._resume()
+                    await self._writer.drain()
+            except ConnectionError:
+                self.dropped = True
+                self.close()
+            finally:
+                self._send_time += self._loop.time() - self._busy_since
+                self._busy_since = None
+
+    @property
+    def writable(self):
+        """False while the connection is paused, because too much output is waiting."""
+        return not self.paused
+
+    async def wait_writable(self):
+        """Wait until the connection is not paused."""
+        await self._writable.wait()
+
+    def _resume(self):
+        self.paused = False
+        self._writable.set()
+        self.dispatch_event('on_resume_writing')
+
+    def _overflow(self, message):
+        self.overflows += 1
+        if self._policy == 'disconnect':
             self.close()
+            return
+
+        self.dropped_bytes += len(message)
+        if self._policy == 'coalesce':
+            self.dropped_bytes += self.outbox_size
+            self._outbox.clear()
+            self._bulk.clear()
+            if self.paused:
+                self._resume()
+        self.dispatch_event('on_overflow')
+
+    @property
+    def outbox_size(self):
+        """The number of bytes waiting to be sent, in both lanes."""
+        return len(self._outbox) + len(self._bulk)
+
+    @property
+    def bulk_pending(self):
+        """The number of bytes of bulk output waiting to be sent."""
+        return len(self._bulk)
+
+    @property
+    def pacing_lag(self):
+        """How far, in seconds, sending has fallen behind the target bps.
+
+        This is the time spent with output pending, less the time the
+        bytes sent so far should have taken.
+        """
+        busy = self._send_time
+        if self._busy_since is not None:
+            busy += self._loop.time() - self._busy_since
+        return max(0.0, busy - self.bytes_sent * _BITS_PER_BYTE / self.bps)
 
     def send(self, message):
-        # Synchrounously send a message in a async coroutine.
+        """Queue a message for sending, on the interactive lane.
+
+        Messages are buffered, and merged with any other pending
+        output into as few writes as possible.
+        """
+        self._queue(self._outbox, message)
+
+    def send_bulk(self, message):
+        """Queue a message for sending, on the bulk lane.
+
+        It is sent once there is no interactive output waiting, and
+        can be withdrawn with `cancel_bulk` until then.
+        """
+        self._queue(self._bulk, message)
+
+    def cancel_bulk(self):
+        """Withdraw any bulk output that has not been sent yet.
+
+        Returns the number of bytes withdrawn, from the end of what
+        was queued with `send_bulk`.
+        """
+        withdrawn = len(self._bulk)
+        if withdrawn:
+            self._bulk.clear()
+            if self.paused and self.outbox_size <= self._low_water:
+                # Writable straight away, but the event waits, as
+                # whoever cancelled is usually about to send more:
+                self.paused = False
+                self._writable.set()
+                self._loop.call_soon(self.dispatch_event, 'on_resume_writing')
+        return withdrawn
+
+    def _queue(self, lane, message):
         if self._writer.transport is None or self._writer.transport.is_closing():
+            if not self._closed:
+                self.dropped = True
             self.close()
             return
-        _future = _asyncio.run_coroutine_threadsafe(self._send(message), self._loop)
+        if self.outbox_size + len(message) > self._limit:
+            self._overflow(message)
+            return
+
+        lane += message
+        self._pending.set()
+        if not self.paused and self.outbox_size > self._high_water:
+            self.paused = True
+            self._writable.clear()
+            self.dispatch_event('on_pause_writing')
 
     def on_receive(self, message):
         """Event for received messages."""
 
+    def on_receive_batch(self, message):
+        """Event for a chunk of received bytes.
+
+        Unless a handler returns EVENT_HANDLED, the chunk is split up
+        and dispatched as individual `on_receive` events.
+        """
+        for key in split_keys(message):
+            self.dispatch_event('on_receive', key)
+
     def on_disconnect(self, connection):
         """Event for disconnection. """
 
-    def __del__(self):
-        print("Garbage Collected: ", self)
+    def on_pause_writing(self):
+        """Event for the outbound buffer going over its high water mark."""
+
+    def on_resume_writing(self):
+        """Event for the outbound buffer draining to its low water mark."""
+
+    def on_overflow(self):
+        """Event for output that was discarded, because the outbound buffer was full."""
 
 
 AsyncConnection.register_event_type('on_receive')
+AsyncConnection.register_event_type('on_receive_batch')
 AsyncConnection.register_event_type('on_disconnect')
+AsyncConnection.register_event_type('on_pause_writing')
+AsyncConnection.register_event_type('on_resume_writing')
+AsyncConnection.register_event_type('on_overflow')
+
+
+_storage_metrics = [
+    ('waiting', 'gauge', "Storage operations waiting for a free slot."),
+    ('queued', 'gauge', "Storage operations queued or running on the storage threads."),
+    ('queue_depth', 'gauge', "Storage operations not yet finished."),
+    ('completed', 'counter', "Storage operations finished."),
+    ('batches', 'counter', "Batches of updates written."),
+    ('batched_updates', 'counter', "Updates written in batches."),
+]
 
 
 class Server(_EventDispatcher):
+    """The BBS.
+
+    With more than one worker, each worker is a separate process that
+    accepts callers on the same port. The wall, the list of callers
+    online, and broadcasts are then shared through a
+    :py:class:`~gibson.broker.Broker`, which runs in this process.
+
+    If `metrics_port` is given, metrics are served on localhost at
+    ``http://127.0.0.1:<metrics_port>/metrics``. Each worker serves its
+    own, on the ports following `metrics_port`.
+
+    With `instrument`, handler latencies are recorded per screen, and
+    included in the metrics. Sending the process SIGUSR1 then samples
+    the event loop for `profile_window` seconds, and writes the stacks
+    to a ``gibson-<pid>-<time>.folded`` file.
+
+    `send_buffer` and `overflow_policy` bound each caller's outbound
+    buffer, and `optimize_output` passes it through the PETSCII peephole
+    optimizer. With `telnet`, callers are expected to speak Telnet. See
+    :py:class:`AsyncConnection`.
+
+    `max_sessions` and `max_per_host` limit the sessions at once, in
+    total and from any one remote host. These apply to each worker.
+    Callers over the limit are sent an "all lines busy" screen, and
+    disconnected. Callers who send nothing for `idle_timeout` seconds
+    are disconnected. See :py:mod:`gibson.admission`.
+
+    With `resume_window`, the Session of a caller whose line drops is
+    parked for that many seconds. If they call back from the same host
+    in that time, and type the resume code from their main menu, they
+    go straight back to where they were. At most `resume_capacity`
+    Sessions are parked at once, per worker. See :py:mod:`gibson.resume`.
+
+    Within a worker, Sessions and screens can `subscribe` to a topic,
+    and are passed every message `publish`ed on it. New wall entries
+    are published on 'wall', and announcements on 'announce', as a
+    :py:class:`~gibson.bulletin.Bulletin`.
+    """
 
-    def __init__(self, address, port, bps=9600):
+    profile_window = 10.0
+
+    def __init__(self, address, port, bps=9600, resources=_default_resources, check_resources=False,
+                 database='gibson.db', workers=1, metrics_port=None, instrument=False,
+                 send_buffer=_send_buffer, overflow_policy='coalesce', optimize_output=False,
+                 telnet=False, max_sessions=None, max_per_host=None, idle_timeout=None,
+                 resume_window=None, resume_capacity=64):
         print(f"Listening on {address}:{port}.")
 
         self._address = address
         self._port = port
         self._bps = bps
+        self._database = database
+        self._workers = workers
+        self._metrics_port = metrics_port
+        self._send_buffer = send_buffer
+        self._overflow_policy = overflow_policy
+        self._optimize_output = optimize_output
+        self._telnet = telnet
+        self._idle_timeout = idle_timeout
+        self._resume_window = resume_window
+        self._resume_capacity = resume_capacity
+        self.admission = _AdmissionControl(max_sessions, max_per_host)
+        self.reaper = None
+        self.parked = None
+        self.counters = _ServerCounters()
+
+        self.timings = None
+        self._profiler = None
+        if instrument:
+            self.timings = _HandlerTimings()
+            self.timings.install(Session, get_screen_classes().values())
+
+        # Packed once, and shared by all Sessions:
+        self.assets = _AssetBundle(resources, check_stat=check_resources)
+        self._busy_screen = _render_busy_screen(self.assets)
+        if telnet:
+            self._busy_screen = _escape_iac(self._busy_screen)
+
+        # Opened in the worker processes, or by the Broker:
+        self.database = None
+        self.storage = None
+        self.wall = None
+        self.broker = None
+        self.online = []
+
+        if workers == 1:
+            # Disk I/O runs on the storage threads, off the event loop:
+            self.database = _Database(database)
+            self.storage = _AsyncDatabase(self.database)
+            self.wall = _Wall(archive=self.storage)
+
+        if self.wall is not None:
+            self.wall.set_handler('on_entry', self._wall_entry)
+
+        # topic -> {callback: None}, as an ordered set:
+        self._subscribers = {}
 
         self._sessions = {}
         self._server = None
+        self._closing = False
+        self._pacer = _Pacer()
 
     async def handle_connection(self, reader, writer):
-        connection = AsyncConnection(reader, writer, self._bps)
-        self.dispatch_event('on_connection', connection)
+        host = writer.get_extra_info('peername')[0]
+        if self.admission.admit(host) is not None:
+            # Turned away, without a Session. The screen is sent
+            # before the socket closes, unless the caller won't take it:
+            writer.write(self._busy_screen)
+            try:
+                await _asyncio.wait_for(writer.drain(), _busy_timeout)
+            except (ConnectionError, _asyncio.TimeoutError):
+                pass
+            writer.close()
+            return
 
-    async def _start_server(self):
-        self._server = await _asyncio.start_server(self.handle_connection, self._address, self._port)
+        connection = None
+        try:
+            connection = AsyncConnection(reader, writer, self._bps, self._pacer,
+                                         self._send_buffer, self._overflow_policy, self._optimize_output,
+                                         self._telnet)
+            self.dispatch_event('on_connection', connection)
+        except Exception:
+            if connection is not None and connection in self._sessions:
+                # Cleaned up, and the slot given back, as it closes:
+                connection.close()
+            else:
+                # The slot is otherwise only given back on disconnection:
+                self.admission.release(host)
+                if connection is not None:
+                    connection.remove_handler('on_disconnect', self._connection_cleanup)
+                    connection.close()
+                else:
+                    writer.close()
+            raise
+
+    async def _start_server(self, worker=0):
+        if self._idle_timeout is not None:
+            self.reaper = _IdleReaper(self._idle_timeout)
+        if self._resume_window is not None:
+            self.parked = _ParkedSessions(self._resume_window, self._resume_capacity)
+        if self.timings is not None and hasattr(_signal, 'SIGUSR1'):
+            _asyncio.get_running_loop().add_signal_handler(_signal.SIGUSR1, self.start_profile)
+        if self._metrics_port is not None:
+            await _MetricsEndpoint(self.collect_metrics, self._metrics_port + worker).start()
+        self._server = await _asyncio.start_server(self.handle_connection, self._address, self._port,
+                                                   reuse_port=self._workers > 1)
+        if self._closing:
+            # Closed while starting up:
+            self._server.close()
+            return
         async with self._server:
             await self._server.serve_forever()
 
     def run(self):
+        if self._workers > 1:
+            self._run_workers()
+            return
         try:
             _asyncio.run(self._start_server())
         except KeyboardInterrupt:
+            self.close()
+        finally:
+            if self.storage is not None:
+                # Waits for the last writes, and syncs them:
+                self.storage.close()
+
+    def close(self):
+        """Stop taking callers.
+
+        This can be called at any time, even before the server has
+        started listening.
+        """
+        self._closing = True
+        if self._server is not None:
             self._server.close()
 
+    def _run_workers(self):
+        directory = _tempfile.mkdtemp(prefix='gibson-')
+        path = _os.path.join(directory, 'broker.sock')
+
+        # Forked before the Broker starts any threads:
+        context = _multiprocessing.get_context('fork')
+        processes = [context.Process(target=self._run_worker, args=(path, number), name=f"Worker {number}")
+                     for number in range(self._workers)]
+        for process in processes:
+            process.start()
+
+        broker = _Broker(path, self._database)
+        try:
+            _asyncio.run(broker.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+            broker.storage.close()
+            _shutil.rmtree(directory, ignore_errors=True)
+
+    def _run_worker(self, path, number):
+        try:
+            _asyncio.run(self._start_worker(path, number))
+        except (KeyboardInterrupt, _asyncio.CancelledError, _BrokerError):
+            # Interrupted, or closed after losing the Broker, which
+            # may have happened before it started listening:
+            pass
+
+    async def _start_worker(self, path, number):
+        self.broker = _BrokerClient(path)
+        await self.broker.connect()
+        self.broker.set_handler('on_online', self._set_online)
+        self.broker.set_handler('on_broadcast', self._broker_broadcast)
+        self.broker.set_handler('on_broker_lost', self._broker_lost)
+
+        self.wall = _SharedWall(self.broker)
+        self.wall.set_handler('on_entry', self._wall_entry)
+        reply = await self.wall.sync()
+        self.online = reply['online']
+        await self._start_server(number)
+
+    def start_profile(self, duration=None):
+        """Sample the event loop for a while, and write the stacks to a file.
+
+        This must be called from the event loop's thread.
+        """
+        if self._profiler is not None and self._profiler.running:
+            return
+        filename = f"gibson-{_os.getpid()}-{_time.strftime('%Y%m%d-%H%M%S')}.folded"
+        duration = duration or self.profile_window
+        print(f"Profiling for {duration}s, into {filename}.")
+        self._profiler = _SamplingProfiler()
+        self._profiler.start(duration, filename)
+
+    def _set_online(self, callers):
+        self.online = callers
+
+    def _broker_broadcast(self, topic, data):
+        self.dispatch_event('on_broadcast', topic, data)
+
+    def _broker_lost(self):
+        print("Lost the Broker. Shutting down.")
+        self.close()
+
+    def _update_online(self):
+        callers = [connection.address for connection in self._sessions]
+        if self.broker is None:
+            self.online = callers
+        else:
+            self.broker.notify('presence', callers=callers)
+
+    def broadcast(self, topic, data):
+        """Send an `on_broadcast` event to every worker, this one included.
+
+        :Parameters:
+            `topic` : str
+                What the broadcast is about.
+            `data` :
+                Anything that can be serialized to JSON.
+        """
+        if self.broker is None:
+            self.dispatch_event('on_broadcast', topic, data)
+        else:
+            self.broker.notify('broadcast', topic=topic, data=data)
+
+    def subscribe(self, topic, callback):
+        """Call `callback` with each message published on `topic`, in this worker."""
+        self._subscribers.setdefault(topic, {})[callback] = None
+
+    def unsubscribe(self, topic, callback):
+        """Stop calling `callback` for messages on `topic`."""
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.pop(callback, None)
+
+    def publish(self, topic, message):
+        """Pass `message` to every subscriber of `topic`, in this worker.
+
+        Every subscriber gets the same object, so anything that is the
+        same for every caller, such as encoded PETSCII, should be built
+        once, before publishing. Use `broadcast` to reach every worker.
+        """
+        subscribers = self._subscribers.get(topic)
+        if subscribers:
+            # A snapshot, as subscribers may come and go as they are called:
+            for callback in list(subscribers):
+                callback(message)
+
+    def announce(self, text):
+        """Show a line of text at the top of every caller's screen, at every worker."""
+        self.broadcast('announce', text)
+
+    def _wall_entry(self, number, entry):
+        # Each worker's wall announces the entries it learns of:
+        self.publish('wall', number)
+
+    def collect_metrics(self):
+        """Return a list of :py:class:`~gibson.metrics.Metric`, for the current state."""
+        counters = self.counters
+        connections = list(self._sessions)
+
+        received = _Metric('gibson_connection_received_bytes_total', 'counter', "Bytes received, per connection.")
+        sent = _Metric('gibson_connection_sent_bytes_total', 'counter', "Bytes sent, per connection.")
+        outbox = _Metric('gibson_connection_outbox_bytes', 'gauge', "Bytes waiting to be sent, per connection.")
+        lag = _Metric('gibson_connection_pacing_lag_seconds', 'gauge',
+                      "How far sending is behind the target bps, per connection.")
+        for connection in connections:
+            received.add(connection.bytes_received, connection=connection.address)
+            sent.add(connection.bytes_sent, connection=connection.address)
+            outbox.add(connection.outbox_size, connection=connection.address)
+            lag.add(round(connection.pacing_lag, 6), connection=connection.address)
+
+        refused = _Metric('gibson_refused_total', 'counter', "Callers turned away, by reason.")
+        for reason, count in sorted(self.admission.refused.items()):
+            refused.add(count, reason=reason)
+
+        screens = _Metric('gibson_screen_transitions_total', 'counter', "Times each screen was entered.")
+        for name, count in sorted(counters.screens.items()):
+            screens.add(count, screen=name)
+
+        metrics = [
+            _Metric('gibson_sessions', 'gauge', "Active sessions.").add(len(connections)),
+            _Metric('gibson_paused_sessions', 'gauge', "Sessions with too much output waiting.").add(
+                sum(connection.paused for connection in connections)),
+            _Metric('gibson_overflows_total', 'counter', "Times output was discarded, or a caller "
+                    "disconnected, because their outbound buffer was full.").add(
+                counters.overflows + sum(connection.overflows for connection in connections)),
+            _Metric('gibson_accepts_total', 'counter', "Connections accepted.").add(counters.accepts),
+            _Metric('gibson_disconnects_total', 'counter', "Connections closed.").add(counters.disconnects),
+            _Metric('gibson_parked_sessions', 'gauge', "Sessions parked, for callers who may call back.").add(
+                len(self.parked) if self.parked is not None else 0),
+            _Metric('gibson_resumed_sessions_total', 'counter', "Parked sessions picked up again.").add(
+                self.parked.resumed if self.parked is not None else 0),
+            _Metric('gibson_idle_disconnects_total', 'counter', "Connections closed for being idle.").add(
+                self.reaper.reaped if self.reaper is not None else 0),
+            _Metric('gibson_received_bytes_total', 'counter', "Bytes received from all connections.").add(
+                counters.bytes_received + sum(connection.bytes_received for connection in connections)),
+            _Metric('gibson_sent_bytes_total', 'counter', "Bytes sent to all connections.").add(
+                counters.bytes_sent + sum(connection.bytes_sent for connection in connections)),
+            _Metric('gibson_optimized_bytes_total', 'counter', "Bytes left out by the output optimizer.").add(
+                counters.bytes_saved + sum(connection.bytes_saved for connection in connections)),
+            _Metric('gibson_outbox_bytes', 'gauge', "Bytes waiting to be sent, to all connections.").add(
+                sum(connection.outbox_size for connection in connections)),
+            received, sent, outbox, lag, refused, screens,
+        ]
+
+        if self.timings is not None:
+            metrics.extend(self.timings.collect_metrics())
+
+        if self.storage is not None:
+            storage = self.storage.get_metrics()
+            for name, kind, description in _storage_metrics:
+                suffix = '_total' if kind == 'counter' else ''
+                metrics.append(_Metric(f'gibson_storage_{name}{suffix}', kind, description).add(storage[name]))
+        return metrics
+
     def _connection_cleanup(self, connection):
-        del self._sessions[connection]
+        session = self._sessions.pop(connection)
+        if self.parked is not None and connection.dropped and session.current_screen.resumable:
+            # The line dropped. They may well call back:
+            session.park()
+            self.parked.park(connection.host, session)
+        else:
+            session.close()
+        self.counters.disconnects += 1
+        self.counters.bytes_received += connection.bytes_received
+        self.counters.bytes_sent += connection.bytes_sent
+        self.counters.bytes_saved += connection.bytes_saved
+        self.counters.overflows += connection.overflows
+        self.admission.release(connection.host)
+        if self.reaper is not None:
+            self.reaper.remove(connection)
+        self._update_online()
 
     def on_connection(self, connection):
         """Event for new Connections received."""
         print("Connected <---", connection)
+        self.counters.accepts += 1
         connection.set_handler('on_disconnect', self._connection_cleanup)
-        self._sessions[connection] = Session(connection)
+        # Someone from the same host dropped recently. Ask for their code:
+        waiting = self.parked is not None and connection.host in self.parked
+        self._sessions[connection] = Session(connection, self, 'resume' if waiting else 'splash')
+        if self.reaper is not None:
+            self.reaper.add(connection)
+        self._update_online()
+
+    def resume_session(self, session, code):
+        """Hand a Session's connection over to the Session parked for its host.
+
+        Only if `code` is the parked Session's resume code. The new
+        Session is closed. Returns True if the caller was resumed.
+        """
+        connection = session.connection
+        parked = self.parked.take(connection.host, code) if self.parked is not None else None
+        if parked is None:
+            return False
+        session.close()
+        self._sessions[connection] = parked
+        parked.resume(connection)
+        return True
+
+    def on_broadcast(self, topic, data):
+        """Event for broadcasts, from any worker.
+
+        By default, the data is published to this worker's subscribers.
+        Announcements are rendered once, here, for all of them.
+        """
+        if topic == 'announce':
+            data = _Bulletin(data)
+        self.publish(topic, data)
 
 
 Server.register_event_type('on_connection')
+Server.register_event_type('on_broadcast')
 
 
 class Session:
+    """The state of a single caller.
 
-    def __init__(self, connection):
-        connection.set_handler('on_receive', self.on_receive)
+    Screens are shared by every Session, so anything that belongs to
+    the caller lives here instead. Instances are kept small, so that
+    many idle callers can be held at once. `sys.getsizeof` reports
+    the full size, including the display buffers.
+
+    Flushes that come to more than `bulk_threshold` bytes, such as a
+    whole new screen, go out on the connection's bulk lane. If the
+    caller presses a key before it has all been sent, the rest is
+    withdrawn. Whatever the keys changed is then sent first, on the
+    interactive lane, followed by a fresh diff for the rest.
+
+    A Session whose caller's line drops can be `park`ed, rather than
+    closed, and later `resume`d on a new connection. See
+    :py:mod:`gibson.resume`.
+    """
+
+    bulk_threshold = 64
+
+    __slots__ = ('connection', 'server', 'display', '_terminal', '_stale', '_bulk',
+                 '_current_screen', 'screen_state', 'resume_code')
+
+    def __init__(self, connection, server, screen='splash'):
+        self.server = server
+        # Typed by the caller to pick this Session up again, if it is parked:
+        self.resume_code = _new_resume_code()
+        self._attach(connection)
         connection.send(CLEAR)
 
-        self.connection = weakref.proxy(connection)
+        # What the screens have drawn, and what the caller's terminal shows:
+        self.display = _FrameBuffer()
+        self._terminal = _FrameBuffer()
+        # Set when output was discarded, and the terminal no longer matches:
+        self._stale = False
+        # While bulk output is being sent: the terminal before it,
+        # the output, and the display it was rendered from:
+        self._bulk = None
 
-        self._screens = {}
         self._current_screen = None
+        self.screen_state = None
 
-        self.add_screen('splash', SplashScreen())
-        self.add_screen('login', LoginScreen())
-        self.add_screen('mainmenu', MainMenuScreen())
-        self.add_screen('wall', WallScreen())
+        self.set_screen(screen)
+        self.flush()
 
-        self.set_screen('splash')
+    def __sizeof__(self):
+        return (object.__sizeof__(self) + _sys.getsizeof(self.display) + _sys.getsizeof(self._terminal) +
+                (_sys.getsizeof(self.screen_state) if self.screen_state is not None else 0) +
+                (sum(_sys.getsizeof(part) for part in self._bulk) if self._bulk is not None else 0))
 
-    def add_screen(self, name, instance):
-        instance.session = self
-        self._screens[name] = instance
-        self._current_screen = instance
+    @property
+    def current_screen(self):
+        return self._current_screen
 
     def set_screen(self, name):
-        self._current_screen = self._screens.get(name, self._current_screen)
-        self._current_screen.activate()
+        screen = get_screen(name)
+        if screen is not None:
+            if self._current_screen is not None:
+                self._current_screen.deactivate(self)
+            screens = self.server.counters.screens
+            screens[name] = screens.get(name, 0) + 1
+            self._current_screen = screen
+            self.screen_state = screen.create_state()
+        self._current_screen.activate(self)
 
-    def on_receive(self, message):
-        self._current_screen.handle_input(message)
+    def close(self):
+        """Detach from the connection, once it has been closed."""
+        if self.connection is not None:
+            self._detach()
+        self._current_screen = None
+        self.screen_state = None
+
+    def park(self):
+        """Detach from the connection, once it has dropped, but keep the screen.
+
+        Until the Session is resumed, nothing is sent, and the screen
+        does not hear about new wall entries or announcements.
+        """
+        self._detach()
+        self.connection = None
+        self._bulk = None
+
+    def resume(self, connection):
+        """Carry on with a parked Session, on a new connection.
+
+        The caller's terminal could be showing anything by now, so it is
+        cleared, and the display is sent in a single redraw.
+        """
+        self._attach(connection)
+        self._current_screen.resume(self)
+        self._stale = True
+        self.flush()
+
+    def _attach(self, connection):
+        connection.set_handler('on_receive_batch', self.on_receive_batch)
+        connection.set_handler('on_resume_writing', self.flush)
+        connection.set_handler('on_overflow', self._overflowed)
+        self.server.subscribe('announce', self._announce)
+        self.connection = connection
+
+    def _detach(self):
+        self.connection.remove_handler('on_receive_batch', self.on_receive_batch)
+        self.connection.remove_handler('on_resume_writing', self.flush)
+        self.connection.remove_handler('on_overflow', self._overflowed)
+        self.server.unsubscribe('announce', self._announce)
+        if self._current_screen is not None:
+            self._current_screen.deactivate(self)
+
+    def when_done(self, awaitable, callback, failed=None):
+        """Call `callback` with the result of an awaitable, then flush.
+
+        This lets screens wait on slow work, such as storage, without
+        holding up the event loop. If the awaitable raises, the
+        exception is printed, and passed to `failed` instead, if given.
+        Neither is called if the Session has been closed by then.
+        """
+        def done(future):
+            if self._current_screen is None or future.cancelled():
+                return
+            exception = future.exception()
+            if exception is None:
+                callback(future.result())
+            else:
+                print("Storage failed:", repr(exception))
+                if failed is not None:
+                    failed(exception)
+            self.flush()
+
+        _asyncio.ensure_future(awaitable).add_done_callback(done)
+
+    def flush(self, before=None, renders=None):
+        """Send the caller only what has changed on the display.
+
+        Nothing is sent while the connection is paused. The display
+        keeps every change, so they are all sent as a single update once
+        the caller has caught up.
+
+        :Parameters:
+            `before` : `~gibson.framebuffer.FrameBuffer`
+                The display as it was before the keys just handled. If
+                given, the cells those keys changed are sent first.
+            `renders` : list
+                Renders to share with other Sessions, such as everyone
+                being shown the same new screen. If one of them went
+                from the same terminal to the same display, its output
+                is reused, rather than rendered again. Otherwise, this
+                Session's is added.
+        """
+        connection = self.connection
+        if connection is None:
+            # Parked. Everything is sent when the caller is back:
+            return
+        bulk = self._bulk
+        if bulk is not None:
+            if not connection.bulk_pending:
+                self._bulk = None
+            elif before is None and not self._stale and self.display.matches(bulk[2]):
+                # Nothing new. The bulk output will finish the job:
+                return
+            else:
+                self._cut_bulk()
+        if connection.paused:
+            return
+
+        if self._stale:
+            # Leave quote and insert modes, and start from a blank screen:
+            self._stale = False
+            self._terminal = _FrameBuffer()
+            self._terminal.lowercase = None
+            connection.send(RETURN + CLEAR)
+
+        terminal = self._terminal
+        if before is not None:
+            target = terminal.patched(before, self.display, self.bulk_threshold)
+            if target is not None:
+                data = terminal.render(target)
+                if data:
+                    connection.send(data)
+
+        start = terminal.copy()
+        data = self._render(start, renders)
+        if len(data) > self.bulk_threshold:
+            self._bulk = start, data, self.display.copy()
+            connection.send_bulk(data)
+        elif data:
+            connection.send(data)
+
+    def _render(self, start, renders):
+        terminal = self._terminal
+        display = self.display
+        if renders is None:
+            return terminal.render(display)
+        # How far each has scrolled only matters relative to the other:
+        behind = display.scrolls - terminal.scrolls
+        for shared_start, target, shared_behind, data, end in renders:
+            if (shared_behind == behind and terminal.matches(shared_start, scrolls=False) and
+                    display.matches(target, scrolls=False)):
+                terminal.assign(end)
+                terminal.scrolls = display.scrolls
+                return data
+        data = terminal.render(display)
+        if len(renders) < _shared_renders:
+            renders.append((start.copy(), display.copy(), behind, data, terminal.copy()))
+        return data
+
+    def _cut_bulk(self):
+        # Withdraw the bulk output that hasn't been sent, and work
+        # out what the terminal shows instead. Whatever the pen and
+        # reverse state were left as, the next diff starts from there:
+        start, data, _display = self._bulk
+        self._bulk = None
+        withdrawn = self.connection.cancel_bulk()
+        if withdrawn:
+            sent = len(data) - withdrawn
+            start.write(data[:sent])
+            if start.quote:
+                # Cut inside a pair of quotes. Diffs start outside of
+                # quote mode, so send on up to the closing quote:
+                end = sent
+                while start.quote and end < len(data):
+                    end += 1
+                    start.write(data[end - 1:end])
+                self.connection.send(data[sent:end])
+            self._terminal = start
+
+    def overlay(self, data):
+        """Draw ready-made PETSCII over the display, and send it as is.
+
+        This is for output that is the same for many callers, such as a
+        :py:class:`~gibson.bulletin.Bulletin`: the caller is sent `data`
+        itself, rather than a diff of their display. It must start by
+        moving the cursor to a known place, such as HOME. The screen's
+        own cursor, pen and quote mode are kept.
+
+        If the terminal can't take it as is, because the caller is
+        behind or in quote mode, it is drawn with the next flush.
+        """
+        if self._bulk is not None:
+            # It would otherwise jump ahead of the bulk output:
+            self._cut_bulk()
+        # The cells it covers end up the same on both, whatever they
+        # held before, and the rest are left to the diff:
+        if not (self.connection.paused or self._stale or self._terminal.quote):
+            self.connection.send(data)
+            self._terminal.write(data)
+
+        display = self.display
+        kept = display.x, display.y, display.colour, display.reverse, display.quote
+        display.quote = False
+        display.write(data)
+        display.x, display.y, display.colour, display.reverse, display.quote = kept
+        self.flush()
+
+    def _announce(self, bulletin):
+        self.overlay(bulletin.render(self.display.lowercase))
+
+    def _overflowed(self):
+        # Some output never reached the caller. Redraw everything, once
+        # there is room:
+        self._stale = True
+        if not self.connection.paused:
+            _asyncio.get_event_loop().call_soon(self.flush)
+
+    def on_receive_batch(self, keys):
+        # Keys cut short any bulk output still to be sent, and what
+        # they change is sent first. So keep the display as it was:
+        before = None
+        if self._bulk is not None and self.connection.bulk_pending:
+            before = self.display.copy()
+
+        # Screens may stop part way through a batch, if
+        # the keys they consumed changed the current screen:
+        while keys:
+            keys = keys[self._current_screen.handle_keys(self, keys):]
+            if self._current_screen is None:
+                # A key logged off, and the Session was closed. The
+                # rest of the batch, and the flush, are moot:
+                return _EVENT_HANDLED
+        self.flush(before)
+        return _EVENT_HANDLED
@@ -0,0 +1,170 @@
+"""Awaitable access to a :py:class:`~gibson.database.Database`.
+
+The Database blocks while it reads from disk, and while it waits for
+writes to be synced. `AsyncDatabase` runs that work on a small pool of
+threads of its own, so that the event loop, and every other caller,
+carries on in the meantime.
+
+Updates made in the same iteration of the event loop are gathered up
+and handed to the Database as a single batch, which is appended in one
+write and shares one sync. Writes are applied in the order they were
+made, and a read always sees the writes that were made before it.
+"""
+
+import asyncio
+import concurrent.futures
+
+
+class AsyncDatabase:
+    """Run Database operations on a dedicated, bounded thread pool.
+
+    Reads are coroutines. Updates and deletes return a Future straight
+    away, which can be awaited to find out when the change is on disk,
+    or simply ignored.
+
+    :Parameters:
+        `database` : `~gibson.database.Database`
+            The Database to wrap.
+        `workers` : int
+            The number of threads in the pool.
+        `max_queued` : int
+            The most operations that may be queued or running at once.
+            Beyond that, callers wait for their turn before their
+            operation is queued.
+    """
+
+    def __init__(self, database, workers=2, max_queued=64):
+        self.database = database
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix='AsyncDatabase')
+        self._max_queued = max_queued
+        self._slots = None
+
+        # The updates gathered in this iteration of the loop,
+        # and the most recent write to be handed to the pool:
+        self._batch = None
+        self._last_write = None
+
+        # Metrics:
+        self.waiting = 0
+        self.queued = 0
+        self.completed = 0
+        self.batches = 0
+        self.batched_updates = 0
+
+    @property
+    def queue_depth(self):
+        """The number of operations not yet finished.
+
+        This includes operations waiting for a slot, and a batch of
+        updates still being gathered.
+        """
+        return self.waiting + self.queued + (self._batch is not None)
+
+    def get_metrics(self):
+        """Return a dict of the current counters."""
+        return {'waiting': self.waiting, 'queued': self.queued, 'queue_depth': self.queue_depth,
+                'completed': self.completed, 'batches': self.batches,
+                'batched_updates': self.batched_updates}
+
+    async def _run(self, function, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_queued)
+
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.queued += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        finally:
+            self.queued -= 1
+            self.completed += 1
+            self._slots.release()
+
+    # Reading:
+
+    async def _read(self, function, *args):
+        pending = self._batch[1] if self._batch is not None else self._last_write
+        if pending is not None and not pending.done():
+            await asyncio.wait([pending])
+        return await self._run(function, *args)
+
+    async def get(self, key, default=None):
+        """Get the value for a key, or `default` if it does not exist."""
+        return await self._read(self.database.get, key, default)
+
+    async def keys(self, start=None, stop=None):
+        """Return a sorted list of the keys with start <= key < stop."""
+        return await self._read(self.database.keys, start, stop)
+
+    async def scan(self, start=None, stop=None):
+        """Return a sorted list of (key, value) pairs, with start <= key < stop."""
+        return await self._read(self.database.scan, start, stop)
+
+    async def scan_prefix(self, prefix):
+        """Return a sorted list of (key, value) pairs whose keys start with `prefix`."""
+        return await self._read(self.database.scan_prefix, prefix)
+
+    # Writing:
+
+    def update(self, key, value):
+        """Set the value for a key.
+
+        Returns a Future that is done once the update has been written.
+        """
+        if self._batch is None:
+            loop = asyncio.get_running_loop()
+            self._batch = [], loop.create_future()
+            loop.call_soon(self._submit_batch)
+
+        items, future = self._batch
+        items.append((key, value))
+        return future
+
+    def _submit_batch(self):
+        if self._batch is None:
+            # Already submitted, ahead of a delete:
+            return
+        items, future = self._batch
+        self._batch = None
+        self.batches += 1
+        self.batched_updates += len(items)
+
+        task = self._write(self.database.update_many, items)
+        task.add_done_callback(lambda task: _chain(task, future))
+
+    def _write(self, function, *args):
+        self._last_write = asyncio.ensure_future(self._write_after(self._last_write, function, *args))
+        return self._last_write
+
+    async def _write_after(self, previous, function, *args):
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        return await self._run(function, *args)
+
+    def delete(self, key):
+        """Remove a key.
+
+        Returns a Future that is done once the deletion has been written.
+        """
+        self._submit_batch()
+        return self._write(self.database.delete, key)
+
+    def close(self):
+        """Wait for queued operations to finish, and close the Database."""
+        self._executor.shutdown(wait=True)
+        self.database.close()
+
+
+def _chain(task, future):
+    if future.cancelled():
+        return
+    if task.cancelled():
+        future.cancel()
+    elif task.exception() is not None:
+        future.set_exception(task.exception())
+    else:
+        future.set_result(None)
@@ -0,0 +1,188 @@
+"""Telnet framing, for callers on WiFi modems and emulators.
+
+Many callers reach the BBS over Telnet rather than a raw socket. Their
+input is then mixed with option negotiation, which would otherwise be
+taken for keystrokes, and any 0xFF byte in the output has to be sent
+twice, or the other end takes it for the start of a command.
+
+A :py:class:`TelnetFilter` sits between a connection's socket and
+everything above it. Input is scanned for IAC with `bytes.find`, and
+the data between commands is passed on in slices, so the work done in
+Python is per command rather than per byte. Commands that arrive split
+across reads are picked up where they left off. Output is escaped with
+a single `bytes.replace`.
+
+The server offers BINARY in both directions, so that PETSCII passes
+through 8 bits clean, and ECHO and SUPPRESS-GO-AHEAD, so that the
+client sends each key as it is typed, and leaves echoing to the BBS.
+Every other option is refused.
+"""
+
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+BINARY = 0
+ECHO = 1
+SGA = 3
+
+_IAC = bytes((IAC,))
+_CR = b'\r'
+
+# Options the server will enable on its side, and on the client's:
+_local_options = frozenset((BINARY, ECHO, SGA))
+_remote_options = frozenset((BINARY, SGA))
+
+# Parser states:
+_DATA, _COMMAND, _OPTION, _SUBNEGOTIATION, _SUBNEGOTIATION_IAC = range(5)
+
+
+def escape_iac(data):
+    """Return data with every 0xFF doubled, as Telnet requires."""
+    return data.replace(_IAC, _IAC + _IAC)
+
+
+class TelnetFilter:
+    """Strips Telnet commands from input, escapes output, and negotiates options.
+
+    Negotiation follows RFC 1143, in short: each side of each option is
+    on or off, and a reply is only sent when that changes, or to refuse
+    a request, so the two ends never get into a loop.
+
+    :Parameters:
+        `reply` : callable
+            Called with the bytes of each negotiation reply, which
+            should be sent as they are, without escaping.
+    """
+
+    __slots__ = '_reply', '_state', '_command', '_local', '_remote', '_requested', '_after_cr'
+
+    def __init__(self, reply):
+        self._reply = reply
+        self._state = _DATA
+        self._command = None
+        # Options that are on, on each side:
+        self._local = set()
+        self._remote = set()
+        # (command, option) sent, and not yet answered:
+        self._requested = set()
+        # A CR ended the last input, so a NUL or LF may follow:
+        self._after_cr = False
+
+    @property
+    def binary(self):
+        """True if the client sends 8 bit data, rather than NVT text."""
+        return BINARY in self._remote
+
+    def negotiate(self):
+        """Offer the options the server wants, at the start of a connection."""
+        requests = [(WILL, BINARY), (DO, BINARY), (WILL, SGA), (DO, SGA), (WILL, ECHO)]
+        self._requested.update(requests)
+        self._reply(b''.join(bytes((IAC, command, option)) for command, option in requests))
+
+    def receive(self, data):
+        """Return the data in a chunk of input, without any Telnet commands."""
+        if self._state == _DATA and IAC not in data:
+            out = data
+        else:
+            out = self._parse(data)
+        if BINARY not in self._remote and (self._after_cr or _CR in out):
+            out = self._strip_cr(out)
+        return out
+
+    def escape(self, data):
+        """Return output ready to be sent.
+
+        0xFF is doubled and, until the server's side is in BINARY mode,
+        each CR is followed by a NUL, as NVT text requires.
+        """
+        if IAC in data:
+            data = escape_iac(data)
+        if BINARY not in self._local and _CR in data:
+            data = data.replace(_CR, b'\r\0')
+        return data
+
+    def _parse(self, data):
+        out = bytearray()
+        position = 0
+        length = len(data)
+        while position < length:
+            state = self._state
+            if state == _DATA:
+                end = data.find(_IAC, position)
+                if end < 0:
+                    out += data[position:]
+                    break
+                out += data[position:end]
+                position = end + 1
+                self._state = _COMMAND
+                continue
+
+            if state == _SUBNEGOTIATION:
+                # Nothing is subnegotiated, so it is skipped:
+                end = data.find(_IAC, position)
+                if end < 0:
+                    break
+                position = end + 1
+                self._state = _SUBNEGOTIATION_IAC
+                continue
+
+            code = data[position]
+            position += 1
+            if state == _COMMAND:
+                if code == IAC:
+                    out.append(IAC)
+                    self._state = _DATA
+                elif WILL <= code <= DONT:
+                    self._command = code
+                    self._state = _OPTION
+                elif code == SB:
+                    self._state = _SUBNEGOTIATION
+                else:
+                    # NOP, GA, AYT and the rest are ignored:
+                    self._state = _DATA
+            elif state == _OPTION:
+                self._negotiate(self._command, code)
+                self._state = _DATA
+            else:
+                self._state = _DATA if code == SE else _SUBNEGOTIATION
+        return bytes(out)
+
+    def _strip_cr(self, data):
+        # NVT text sends RETURN as CR NUL or CR LF. The C64 only wants the CR.
+        # A chunk that was all commands leaves the pair open:
+        if not data:
+            return data
+        if self._after_cr and data[:1] in (b'\0', b'\n'):
+            data = data[1:]
+        data = data.replace(b'\r\0', _CR).replace(b'\r\n', _CR)
+        self._after_cr = data.endswith(_CR)
+        return data
+
+    def _negotiate(self, command, option):
+        if command == WILL or command == WONT:
+            enabled, supported, accept, refuse = self._remote, _remote_options, DO, DONT
+        else:
+            enabled, supported, accept, refuse = self._local, _local_options, WILL, WONT
+
+        if command == WILL or command == DO:
+            requested = (accept, option) in self._requested
+            self._requested.discard((accept, option))
+            if option not in supported:
+                self._reply(bytes((IAC, refuse, option)))
+            elif option not in enabled:
+                enabled.add(option)
+                if not requested:
+                    self._reply(bytes((IAC, accept, option)))
+        else:
+            requested = (accept, option) in self._requested or (refuse, option) in self._requested
+            self._requested.discard((accept, option))
+            self._requested.discard((refuse, option))
+            if option in enabled or requested:
+                enabled.discard(option)
+                if not requested:
+                    self._reply(bytes((IAC, refuse, option)))
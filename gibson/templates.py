@@ -0,0 +1,90 @@
+"""Screens that are drawn once, and shared by every Session.
+
+Most of a screen is the same for every caller: the .seq artwork, the
+title and the menu. A :py:class:`Template` holds those parts, already
+drawn on a :py:class:`~gibson.framebuffer.FrameBuffer`, so showing it
+is a copy of a few buffers rather than interpreting the PETSCII again.
+Anything that changes, such as the date or the number of callers, goes
+in a named slot, which is filled in each time the template is shown.
+
+Templates are compiled by running a screen's ordinary drawing code
+against a stand-in for the Session (see `compile_template`).
+"""
+
+from .framebuffer import FrameBuffer, WIDTH
+from .petscii import *
+
+
+class Template:
+    """The static part of a screen, and the slots for its dynamic fields.
+
+    :Parameters:
+        `frame` : `~gibson.framebuffer.FrameBuffer`
+            The screen, as drawn. It is not copied, so it should not
+            be drawn on again.
+        `slots` : dict
+            Slot name -> (column, row, width, colour code).
+    """
+
+    __slots__ = 'frame', 'slots'
+
+    def __init__(self, frame, slots=None):
+        self.frame = frame
+        self.slots = dict(slots or {})
+        for name, (column, row, width, _colour) in self.slots.items():
+            if column + width > WIDTH:
+                raise ValueError(f"Slot {name!r} runs off the end of row {row}")
+
+    def show(self, display, **values):
+        """Copy the template onto a display, and fill in the slots.
+
+        Each value is converted with `str`, and cut off, or padded with
+        spaces, to the width of its slot. Slots without a value are left
+        blank. The cursor and pen are left where the template left them.
+        """
+        frame = self.frame
+        display.assign(frame)
+        if not values:
+            return
+
+        shifted = bool(frame.lowercase)
+        for name, value in values.items():
+            column, row, width, colour = self.slots[name]
+            text = str(value)[:width].ljust(width)
+            display.x, display.y = column, row
+            display.reverse = display.quote = False
+            display.write(colour + encode_petscii(text, 'replace', shifted))
+
+        display.x, display.y = frame.x, frame.y
+        display.colour, display.reverse, display.quote = frame.colour, frame.reverse, frame.quote
+
+
+class _Canvas:
+    """Stands in for a Session, while a template is drawn."""
+
+    __slots__ = 'display', 'server'
+
+    def __init__(self, server, lowercase):
+        self.display = FrameBuffer()
+        self.display.lowercase = lowercase
+        self.server = server
+
+
+def compile_template(draw, server, lowercase, slots=None):
+    """Draw a screen once, and return it as a Template.
+
+    :Parameters:
+        `draw` : callable
+            Called with a stand-in for a Session, that has a `display`
+            and a `server`. Screen methods such as `send` and `_go_to`
+            work with it as they would with a Session.
+        `server` : `~gibson.server.Server`
+            The server whose assets are drawn.
+        `lowercase` : bool
+            The character set the screen is drawn in.
+        `slots` : dict
+            Slot name -> (column, row, width, colour code).
+    """
+    canvas = _Canvas(server, lowercase)
+    draw(canvas)
+    return Template(canvas.display, slots)
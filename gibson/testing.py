@@ -0,0 +1,90 @@
+"""In-memory stand-ins for a connection and a Server.
+
+These let a :py:class:`~gibson.server.Session` and its screens run
+without sockets or storage, for the benchmarks and the tests.
+"""
+
+from .assets import AssetBundle
+from .metrics import ServerCounters
+from .server import _default_resources
+from .wall import Wall
+
+
+class MemoryConnection:
+    """Stands in for an AsyncConnection.
+
+    Output is counted, and kept in `output` if `keep` is set. Bulk
+    output is sent straight away, unless `hold_bulk` is set, in which
+    case it waits in `bulk` until `release`d or withdrawn.
+
+    Closing the connection closes its `session`, if set, as the Server
+    does.
+    """
+
+    address = host = 'memory:0'
+    paused = False
+
+    def __init__(self, keep=False, hold_bulk=False):
+        self.keep = keep
+        self.hold_bulk = hold_bulk
+        self.sent = 0
+        self.output = bytearray()
+        self.bulk = bytearray()
+        self.closed = False
+        self.session = None
+
+    def set_handler(self, name, handler):
+        pass
+
+    def remove_handler(self, name, handler):
+        pass
+
+    def send(self, message):
+        assert not self.closed, "sent to a closed connection"
+        self.sent += len(message)
+        if self.keep:
+            self.output += message
+
+    def send_bulk(self, message):
+        if self.hold_bulk:
+            self.bulk += message
+        else:
+            self.send(message)
+
+    @property
+    def bulk_pending(self):
+        return len(self.bulk)
+
+    def release(self, size):
+        """Send up to `size` bytes of the waiting bulk output."""
+        self.send(self.bulk[:size])
+        del self.bulk[:size]
+
+    def cancel_bulk(self):
+        withdrawn = len(self.bulk)
+        self.bulk.clear()
+        return withdrawn
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if self.session is not None:
+                self.session.close()
+
+
+class StubServer:
+    """Just enough of a Server for the screens."""
+
+    parked = None
+
+    def __init__(self):
+        self.assets = AssetBundle(_default_resources)
+        self.wall = Wall()
+        self.online = []
+        self.counters = ServerCounters()
+
+    def subscribe(self, topic, callback):
+        pass
+
+    def unsubscribe(self, topic, callback):
+        pass
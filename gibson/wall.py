@@ -0,0 +1,198 @@
+"""Storage for the message wall.
+
+Entries are numbered in the order they were posted. The most recent
+entries are kept in memory in a fixed size ring, and every entry is
+also written to an archive (a :py:class:`~gibson.storage.AsyncDatabase`),
+from which older pages are loaded on demand, without blocking the
+event loop.
+
+The wall is shown a page at a time, newest entries first. Each page is
+encoded once, and the PETSCII is cached and shared by every viewer
+until a new entry is posted. Each new entry is announced with the
+`on_entry` event.
+"""
+
+import asyncio
+
+from collections import deque, OrderedDict
+from datetime import datetime
+
+from .event import EventDispatcher
+from .petscii import *
+
+
+_KEY_PREFIX = 'wall/'
+
+# Each entry gets a fixed slot of rows on the page. That
+# is enough for the date, and up to 80 characters of text:
+_ROWS_PER_ENTRY = 4
+
+_welcome = [
+    {'date': "21-Jan-01", 'text': "This is a fantastic BBS!"},
+    {'date': "21-Jan-15", 'text': "Wooo, what a great BBS. The best around!"},
+]
+
+
+def _key(number):
+    return f"{_KEY_PREFIX}{number:010d}"
+
+
+class Wall(EventDispatcher):
+    """A bounded, paginated view of the wall entries.
+
+    :Parameters:
+        `archive` : `~gibson.storage.AsyncDatabase`
+            Where every entry is stored. If None, only the most recent
+            entries are kept, and older ones are forgotten.
+        `recent` : int
+            The number of recent entries to keep in memory.
+        `cached_pages` : int
+            The number of encoded pages to keep.
+    """
+
+    entries_per_page = 5
+
+    def __init__(self, archive=None, recent=100, cached_pages=32):
+        self._archive = archive
+        self._recent = deque(maxlen=max(recent, self.entries_per_page))
+        self._cached_pages = cached_pages
+        self._pages = OrderedDict()
+        self._count = 0
+        self._load()
+
+    def _load(self):
+        archive = self._archive
+        if archive is not None:
+            # This happens before any callers connect, so
+            # it is fine to use the Database directly:
+            database = archive.database
+            keys = database.keys(_KEY_PREFIX, _KEY_PREFIX + '\uffff')
+            self._count = int(keys[-1][len(_KEY_PREFIX):]) + 1 if keys else 0
+            first = max(0, self._count - self._recent.maxlen)
+            for _key_name, entry in database.scan(_key(first), _key(self._count)):
+                self._recent.append(entry)
+
+            if not self._count:
+                database.update_many((_key(number), entry) for number, entry in enumerate(_welcome))
+
+        if not self._count:
+            self._recent.extend(_welcome)
+            self._count = len(_welcome)
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def page_count(self):
+        return max(1, -(-self._count // self.entries_per_page))
+
+    @staticmethod
+    def _get_timestamp():
+        return datetime.now().strftime('%y-%b-%d')
+
+    def post(self, text):
+        """Post a new entry to the wall, dated today.
+
+        The entry is visible straight away. Returns a Future that is
+        done once it has been written to the archive.
+
+        :Parameters:
+            `text` : str
+                The text of the entry.
+        """
+        entry = {'date': self._get_timestamp(), 'text': text}
+        if self._archive is not None:
+            saved = self._archive.update(_key(self._count), entry)
+        else:
+            saved = asyncio.get_running_loop().create_future()
+            saved.set_result(None)
+
+        self._recent.append(entry)
+        self._count += 1
+        # Every page shifts along by one entry:
+        self._pages.clear()
+        self.dispatch_event('on_entry', self._count - 1, entry)
+        return saved
+
+    def _page_range(self, page):
+        stop = self._count - page * self.entries_per_page
+        return max(0, stop - self.entries_per_page), max(0, stop)
+
+    def get_recent(self, count):
+        """Return up to `count` of the newest entries, oldest first.
+
+        Only the entries held in memory are returned.
+        """
+        return self._recent_entries(self._count - count, self._count)
+
+    def _recent_entries(self, first, stop):
+        oldest_recent = self._count - len(self._recent)
+        return [self._recent[number - oldest_recent] for number in range(max(first, oldest_recent), stop)]
+
+    async def get_entries(self, first, stop):
+        """Return the entries numbered first <= number < stop, oldest first.
+
+        Entries older than those in memory are loaded from the archive.
+        """
+        first = max(0, first)
+        stop = min(stop, self._count)
+        oldest_recent = self._count - len(self._recent)
+
+        # Taken first, as the ring may move on while the archive is read:
+        entries = self._recent_entries(first, stop)
+        if first < oldest_recent and self._archive is not None:
+            archived = await self._archive.scan(_key(first), _key(min(stop, oldest_recent)))
+            entries[:0] = [entry for _key_name, entry in archived]
+        return entries
+
+    def get_page(self, page, shifted=True):
+        """Return the PETSCII for a page, if it can be had without the archive.
+
+        Returns None if the page needs entries that are no longer held
+        in memory. Those pages can be loaded with `load_page`.
+        """
+        key = page, shifted
+        if key in self._pages:
+            self._pages.move_to_end(key)
+            return self._pages[key]
+
+        first, stop = self._page_range(page)
+        if first < self._count - len(self._recent) and self._archive is not None:
+            return None
+        return self._cache_page(key, self._recent_entries(first, stop))
+
+    async def load_page(self, page, shifted=True):
+        """Return the PETSCII for a page, loading entries from the archive as needed.
+
+        The entries are drawn from the top of the screen down. Page 0
+        holds the newest entries.
+        """
+        rendered = self.get_page(page, shifted)
+        while rendered is None:
+            count = self._count
+            entries = await self.get_entries(*self._page_range(page))
+            if count == self._count:
+                rendered = self._cache_page((page, shifted), entries)
+            else:
+                # Posted to in the meantime, so the page has shifted:
+                rendered = self.get_page(page, shifted)
+        return rendered
+
+    def _cache_page(self, key, entries):
+        _page, shifted = key
+        rendered = bytearray()
+        for slot, entry in enumerate(reversed(entries)):
+            rendered += HOME + CURSOR_DOWN * (slot * _ROWS_PER_ENTRY)
+            rendered += GREEN + encode_petscii(f"{entry['date']}> ", 'replace', shifted)
+            rendered += LIGHT_BLUE + encode_petscii(entry['text'], 'replace', shifted)
+
+        rendered = self._pages[key] = bytes(rendered)
+        if len(self._pages) > self._cached_pages:
+            self._pages.popitem(last=False)
+        return rendered
+
+    def on_entry(self, number, entry):
+        """Event for a new entry, once it is visible on the wall."""
+
+
+Wall.register_event_type('on_entry')
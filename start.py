@@ -6,9 +6,35 @@ parser = argparse.ArgumentParser(description="Start the Server")
 parser.add_argument('--addr', default='0.0.0.0', help="listen address (defaults to 0.0.0.0)")
 parser.add_argument('--port', type=int, default=6400, help="listen port (defaults to 6400)")
 parser.add_argument('--bitrate', type=int, default=9600, help="set the bitrate (defaults to 9600)")
+parser.add_argument('--dev', action='store_true', help="reload resource files when they change on disk")
+parser.add_argument('--database', default='gibson.db', help="database file (defaults to gibson.db)")
+parser.add_argument('--workers', type=int, default=1, help="number of worker processes (defaults to 1)")
+parser.add_argument('--metrics-port', type=int, help="serve metrics on this localhost port (off by default)")
+parser.add_argument('--instrument', action='store_true',
+                    help="time the screen handlers, and profile the loop on SIGUSR1")
+parser.add_argument('--overflow', choices=('drop', 'coalesce', 'disconnect'), default='coalesce',
+                    help="what to do with callers whose output backs up (defaults to coalesce)")
+parser.add_argument('--max-sessions', type=int, help="most callers at once, per worker (no limit by default)")
+parser.add_argument('--max-per-host', type=int,
+                    help="most callers at once from one address, per worker (no limit by default)")
+parser.add_argument('--idle-timeout', type=float, default=900,
+                    help="disconnect callers idle for this many seconds (defaults to 900, 0 for never)")
+parser.add_argument('--optimize', action='store_true',
+                    help="strip redundant PETSCII codes from the output (off by default)")
+parser.add_argument('--telnet', action='store_true',
+                    help="speak Telnet to callers, rather than raw bytes (off by default)")
+parser.add_argument('--resume-window', type=float, default=0,
+                    help="let callers whose line drops carry on if they call back within this many "
+                         "seconds, with the resume code from their main menu (off by default)")
 args = parser.parse_args()
 
 
 if __name__ == "__main__":
-    server = gibson.Server(args.addr, args.port, args.bitrate)
+    server = gibson.Server(args.addr, args.port, args.bitrate, check_resources=args.dev,
+                           database=args.database, workers=args.workers, metrics_port=args.metrics_port,
+                           instrument=args.instrument, overflow_policy=args.overflow,
+                           optimize_output=args.optimize, telnet=args.telnet,
+                           max_sessions=args.max_sessions, max_per_host=args.max_per_host,
+                           idle_timeout=args.idle_timeout or None,
+                           resume_window=args.resume_window or None)
     server.run()
@@ -0,0 +1,61 @@
+import os
+import random
+import asyncio
+import tempfile
+
+from gibson.admission import AdmissionControl
+from gibson.server import Server
+
+
+def test_admit_and_release_balance():
+    rng = random.Random(19)
+    admission = AdmissionControl(max_sessions=8, max_per_host=3)
+    admitted = []
+    for _step in range(2000):
+        if admitted and rng.random() < 0.5:
+            admission.release(admitted.pop(rng.randrange(len(admitted))))
+        else:
+            host = rng.choice('abcde')
+            if admission.admit(host) is None:
+                admitted.append(host)
+        assert admission.sessions == len(admitted) <= 8
+        assert all(admitted.count(host) <= 3 for host in admitted)
+
+    for host in admitted:
+        admission.release(host)
+    assert admission.sessions == 0 and not admission._hosts
+
+
+def _serve(test, **kwargs):
+    async def main(directory):
+        server = Server('127.0.0.1', 0, database=os.path.join(directory, 'gibson.db'), **kwargs)
+        listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        try:
+            await test(server, listener.sockets[0].getsockname()[1])
+        finally:
+            listener.close()
+            server.database.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(main(directory))
+
+
+def test_busy_screen_is_sent_in_full():
+    async def test(server, port):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        assert await asyncio.wait_for(reader.read(), 5) == server._busy_screen
+        writer.close()
+    _serve(test, max_sessions=0)
+
+
+def test_failed_connections_give_their_slot_back():
+    def fail(connection):
+        raise RuntimeError("on_connection failed")
+
+    async def test(server, port):
+        server.set_handler('on_connection', fail)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        assert await asyncio.wait_for(reader.read(), 5) == b''
+        writer.close()
+        assert server.admission.sessions == 0
+    _serve(test, max_sessions=1)
@@ -0,0 +1,35 @@
+import os
+import asyncio
+import tempfile
+
+from gibson.broker import Broker, BrokerClient
+from gibson.server import Server
+
+
+def test_replies_to_cancelled_requests_are_dropped():
+    async def main(directory):
+        path = os.path.join(directory, 'broker.sock')
+        broker = Broker(path, os.path.join(directory, 'gibson.db'))
+        serving = asyncio.ensure_future(broker.serve())
+        client = BrokerClient(path)
+        lost = []
+        client.set_handler('on_broker_lost', lambda: lost.append(True))
+        await client.connect()
+
+        # The caller gives up before the reply arrives:
+        client.request('hello').cancel()
+        reply = await asyncio.wait_for(client.request('hello'), 5)
+        assert 'count' in reply
+        assert not lost
+
+        serving.cancel()
+        broker.storage.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(main(directory))
+
+
+def test_losing_the_broker_before_listening():
+    server = Server('127.0.0.1', 0, workers=2)
+    server._broker_lost()
+    server.close()
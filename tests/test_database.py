@@ -0,0 +1,59 @@
+import os
+import random
+import tempfile
+
+import pytest
+
+from gibson.database import Database
+
+
+# The sync and compaction threads must not trip over a closed log:
+pytestmark = pytest.mark.filterwarnings('error::pytest.PytestUnhandledThreadExceptionWarning')
+
+
+def _churn(database, rng, model, count):
+    # Overwrites and deletes, so that there is garbage to compact:
+    for _step in range(count):
+        key = f'key{rng.randrange(50):03}'
+        if rng.random() < 0.2:
+            database.delete(key)
+            model.pop(key, None)
+        else:
+            value = {'n': rng.randrange(1000), 'text': 'x' * rng.randrange(200)}
+            database.update(key, value)
+            model[key] = value
+
+
+def test_reopening_after_writes_and_compaction():
+    rng = random.Random(9)
+    model = {}
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'test.db')
+        database = Database(filename, sync=False, compact_min_size=4096)
+        _churn(database, rng, model, 2000)
+        database.compact()
+        _churn(database, rng, model, 200)
+        assert dict(database.scan()) == model
+        database.close()
+
+        database = Database(filename)
+        assert dict(database.scan()) == model
+        assert database.keys() == sorted(model)
+        database.close()
+
+
+def test_closing_waits_for_compaction():
+    rng = random.Random(90)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'test.db')
+        for _attempt in range(20):
+            model = {}
+            database = Database(filename, sync=False, compact_ratio=0.1, compact_min_size=1024)
+            # Compaction runs on its own thread as soon as there is enough garbage:
+            _churn(database, rng, model, 300)
+            database.close()
+            database = Database(filename)
+            for key, value in model.items():
+                assert database.get(key) == value
+            database.close()
+            os.remove(filename)
@@ -0,0 +1,91 @@
+import random
+
+from gibson.framebuffer import FrameBuffer, HEIGHT, UNKNOWN, WIDTH, _blanks, _colour_codes
+from gibson.petscii import *
+
+
+def _random_screen(rng):
+    # Text in random colours and reverse, all over the screen:
+    screen = FrameBuffer()
+    for _piece in range(rng.randrange(1, 40)):
+        x, y = rng.randrange(WIDTH), rng.randrange(HEIGHT - 1)
+        screen.write(screen.plan_move(x, y))
+        screen.write(rng.choice(_colour_codes) + rng.choice((REVERSE_ON, REVERSE_OFF)))
+        screen.write(bytes(rng.choice(b'ABC #*\xa0\xb0') for _ in range(rng.randrange(1, 30))))
+    screen.write(HOME)
+    return screen
+
+
+def _same_cells(a, b):
+    # Colours only show on cells that aren't blank:
+    for i in range(WIDTH * HEIGHT):
+        if a.chars[i] != b.chars[i] or a.reverses[i] != b.reverses[i]:
+            return False
+        if (a.reverses[i] or a.chars[i] not in _blanks) and a.colours[i] != b.colours[i]:
+            return False
+    return True
+
+
+def _check_move(screen, x, y):
+    moved = screen.copy()
+    moved.write(screen.plan_move(x, y))
+    assert (moved.x, moved.y) == (x, y)
+    assert not moved.quote
+    assert moved.reverse == screen.reverse
+    assert screen.colour == UNKNOWN or moved.colour == screen.colour
+    assert moved.scrolls == screen.scrolls
+    assert _same_cells(moved, screen)
+
+
+def test_plan_move_changes_no_cells():
+    rng = random.Random(6)
+    for _case in range(300):
+        screen = _random_screen(rng)
+        screen.write(screen.plan_move(rng.randrange(WIDTH), rng.randrange(HEIGHT)))
+        _check_move(screen, rng.randrange(WIDTH), rng.randrange(HEIGHT))
+
+
+def test_plan_move_leaves_quote_mode():
+    rng = random.Random(60)
+    for _case in range(300):
+        screen = _random_screen(rng)
+        # Open a quote anywhere but the last two cells, where it would scroll:
+        position = rng.randrange(WIDTH * HEIGHT - 2)
+        # Half of them on the bottom row, where a RETURN would scroll:
+        if rng.random() < 0.5:
+            position = (HEIGHT - 1) * WIDTH + position % (WIDTH - 2)
+        screen.write(screen.plan_move(position % WIDTH, position // WIDTH) + b'"')
+        assert screen.quote
+        _check_move(screen, rng.randrange(WIDTH), rng.randrange(HEIGHT))
+
+
+def _same_screen(terminal, target):
+    # The bottom right cell is never printed, as that would scroll:
+    corner = WIDTH * HEIGHT - 1
+    a, b = terminal.copy(), target.copy()
+    for screen in (a, b):
+        screen.chars[corner] = 0x20
+        screen.reverses[corner] = 0
+    return _same_cells(a, b) and (a.x, a.y, a.lowercase) == (b.x, b.y, b.lowercase)
+
+
+def test_render_reaches_the_target():
+    rng = random.Random(5)
+    edits = [CURSOR_DOWN * 30, CLEAR, LOUP_CHARSET, UPGFX_CHARSET, b'"QUOTE" ', b'"', RETURN, HOME,
+             REVERSE_ON, REVERSE_OFF, CURSOR_LEFT * 3, DELETE, INSERT + b'I']
+    for _case in range(300):
+        start = _random_screen(rng)
+        target = start.copy()
+        for _edit in range(rng.randrange(1, 8)):
+            target.write(target.plan_move(rng.randrange(WIDTH), rng.randrange(HEIGHT - 1)))
+            target.write(rng.choice(edits) + rng.choice(_colour_codes) +
+                         bytes(rng.choice(b'XY -') for _ in range(rng.randrange(10))))
+        # Quote mode on the display is not carried over to the terminal:
+        target.write(RETURN if target.quote else b'')
+
+        terminal = start.copy()
+        data = terminal.render(target)
+        replayed = start.copy()
+        replayed.write(data)
+        assert _same_screen(replayed, target)
+        assert _same_screen(terminal, target)
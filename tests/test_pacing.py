@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from gibson.pacing import BITS_PER_BYTE, Pacer
+
+
+def _bucket(bps, interval):
+    async def create():
+        return Pacer(interval).create_bucket(bps)
+    return asyncio.run(create())
+
+
+def _achieved_bps(bps, interval=0.02, seconds=60):
+    # A writer with plenty queued, taking whatever credit each tick has:
+    bucket = _bucket(bps, interval)
+    bucket.tokens = 0
+    start = now = bucket.timestamp
+    sent = 0
+    for _tick in range(round(seconds / interval)):
+        now += interval
+        bucket.refill(now)
+        if bucket.tokens >= 1:
+            sent += bucket.take(4096)
+    return sent * BITS_PER_BYTE / (now - start)
+
+
+def test_slow_links_keep_their_rate():
+    for bps in (300, 1200, 2400):
+        assert abs(_achieved_bps(bps) - bps) / bps < 0.02
+
+
+def test_fast_links_keep_their_rate():
+    assert abs(_achieved_bps(9600) - 9600) / 9600 < 0.02
+
+
+def test_late_ticks_are_made_up():
+    bucket = _bucket(300, 0.02)
+    bucket.tokens = 0.5
+    bucket.refill(bucket.timestamp + 0.04)
+    assert bucket.tokens == pytest.approx(1.7)
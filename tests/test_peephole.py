@@ -0,0 +1,53 @@
+import random
+
+from gibson.assets import AssetBundle
+from gibson.framebuffer import FrameBuffer, _colour_codes
+from gibson.peephole import PeepholeOptimizer, equivalent, optimize
+from gibson.petscii import *
+from gibson.server import _default_resources
+
+
+_codes = [CURSOR_UP, CURSOR_DOWN, CURSOR_LEFT, CURSOR_RIGHT, HOME, RETURN, SHIFT_RETURN, REVERSE_ON,
+          REVERSE_OFF, LOUP_CHARSET, UPGFX_CHARSET, DELETE, INSERT, CLEAR, b'"'] + list(_colour_codes)
+
+
+def _random_stream(rng, length):
+    stream = bytearray()
+    while len(stream) < length:
+        if rng.random() < 0.5:
+            stream += rng.choice(_codes) * rng.randrange(1, 4)
+        else:
+            stream += bytes(rng.choice(b'AB #') for _ in range(rng.randrange(1, 8)))
+    return bytes(stream)
+
+
+def test_optimized_streams_draw_the_same_screen():
+    rng = random.Random(23)
+    for _case in range(500):
+        stream = _random_stream(rng, rng.randrange(1, 120))
+        assert equivalent(stream, optimize(stream)), stream
+
+
+def test_streams_fed_in_pieces():
+    rng = random.Random(230)
+    for _case in range(300):
+        stream = _random_stream(rng, rng.randrange(1, 200))
+        start = FrameBuffer()
+        start.write(_random_stream(rng, 40).replace(b'"', b'') + RETURN)
+        optimizer = PeepholeOptimizer(start)
+        optimized = bytearray()
+        position = 0
+        while position < len(stream):
+            size = rng.randrange(1, 20)
+            optimized += optimizer.feed(stream[position:position + size])
+            position += size
+        assert equivalent(stream, bytes(optimized), start), stream
+
+
+def test_artwork_gets_smaller():
+    assets = AssetBundle(_default_resources)
+    for name in assets.names:
+        artwork = bytes(assets[name])
+        optimized = optimize(artwork)
+        assert len(optimized) <= len(artwork)
+        assert equivalent(artwork, optimized), name
@@ -0,0 +1,28 @@
+import pytest
+
+from gibson.petscii import ascii_to_petscii, decode_petscii, encode_petscii
+
+
+_punctuation = '\\^_`{|}~'
+
+
+def test_printable_ascii_encodes_as_before():
+    # Every printable ASCII character has a code, as with the old table:
+    for code in range(0x20, 0x7F):
+        char = chr(code)
+        assert encode_petscii(char) == bytes((ascii_to_petscii[code],)), char
+
+
+def test_punctuation_without_a_glyph():
+    assert encode_petscii("a_b") == b'A_B'
+    for shifted in (True, False):
+        encoded = encode_petscii(_punctuation, shifted=shifted)
+        assert encoded == b'\\^_\xc0\xdb\xdc\xdd\xde'
+        # The glyphs they are shown as encode back to the same codes:
+        assert encode_petscii(decode_petscii(encoded, shifted=shifted), shifted=shifted) == encoded
+
+
+def test_unmappable_characters_follow_errors():
+    with pytest.raises(UnicodeEncodeError):
+        encode_petscii("\u20ac")
+    assert encode_petscii("\u20ac", 'replace') == b'?'
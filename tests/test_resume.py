@@ -0,0 +1,55 @@
+import asyncio
+
+from gibson.resume import RESUME_CODE_ALPHABET, RESUME_CODE_LENGTH, ParkedSessions, new_resume_code
+
+
+class _Session:
+    def __init__(self):
+        self.resume_code = new_resume_code()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _run(test):
+    async def main():
+        test(ParkedSessions(60, capacity=2, max_attempts=3))
+    asyncio.run(main())
+
+
+def test_resume_codes():
+    code = new_resume_code()
+    assert len(code) == RESUME_CODE_LENGTH
+    assert set(code) <= set(RESUME_CODE_ALPHABET)
+
+
+def test_only_the_right_code_resumes():
+    def test(parked):
+        session = _Session()
+        parked.park('10.0.0.1', session)
+        assert parked.take('10.0.0.2', session.resume_code) is None
+        assert parked.take('10.0.0.1', '') is None
+        assert parked.take('10.0.0.1', session.resume_code) is session
+        assert '10.0.0.1' not in parked and not session.closed
+    _run(test)
+
+
+def test_wrong_codes_close_the_session():
+    def test(parked):
+        session = _Session()
+        parked.park('10.0.0.1', session)
+        wrong = 'A' * RESUME_CODE_LENGTH if session.resume_code != 'A' * RESUME_CODE_LENGTH else 'B' * RESUME_CODE_LENGTH
+        for _attempt in range(3):
+            assert parked.take('10.0.0.1', wrong) is None
+        assert session.closed and '10.0.0.1' not in parked
+    _run(test)
+
+
+def test_capacity_closes_the_oldest():
+    def test(parked):
+        sessions = [_Session() for _ in range(3)]
+        for number, session in enumerate(sessions):
+            parked.park(f'10.0.0.{number}', session)
+        assert sessions[0].closed and len(parked) == 2
+    _run(test)
@@ -0,0 +1,126 @@
+import random
+import asyncio
+
+from gibson.framebuffer import FrameBuffer
+from gibson.petscii import *
+from gibson.server import Session
+from gibson.testing import MemoryConnection, StubServer
+
+
+def _session():
+    connection = MemoryConnection()
+    session = connection.session = Session(connection, StubServer())
+    return session, connection
+
+
+def test_keys_after_logging_off_are_dropped():
+    session, connection = _session()
+    session.set_screen('mainmenu')
+    session.flush()
+
+    session.on_receive_batch(b'Q\r')
+    assert connection.closed
+    assert session.current_screen is None
+
+
+
+def _cut_short(page, key, offset):
+    # Draws the page, sends `offset` bytes of it, then a key changes the
+    # screen. Returns the Session, or None if the page is shorter:
+    connection = MemoryConnection(keep=True, hold_bulk=True)
+    session = Session(connection, StubServer())
+    connection.release(connection.bulk_pending)
+    session.display.write(page)
+    session.flush()
+    if offset > connection.bulk_pending:
+        return None
+    connection.release(offset)
+    session.display.write(key)
+    session.flush()
+    connection.release(connection.bulk_pending)
+    return session
+
+
+def test_cutting_bulk_output_short_anywhere():
+    for seed in range(10):
+        rng = random.Random(seed)
+        # Rows of text with quotes in, which are drawn in pairs:
+        page = CLEAR + b''.join(rng.choice((CYAN, YELLOW, PINK)) +
+                                bytes(rng.choice(b'AB "') for _ in range(rng.randrange(1, 12))) +
+                                rng.choice((RETURN, b' ', CURSOR_DOWN)) for _ in range(8))
+        key = HOME + CURSOR_DOWN * rng.randrange(3) + WHITE + b'K'
+
+        offset = 0
+        while True:
+            session = _cut_short(page, key, offset)
+            if session is None:
+                break
+            # What the caller's terminal shows, from everything it was sent:
+            terminal = FrameBuffer()
+            terminal.write(session.connection.output)
+            display = session.display
+            assert terminal.chars == display.chars, (seed, offset)
+            assert terminal.reverses == display.reverses, (seed, offset)
+            assert (terminal.x, terminal.y) == (display.x, display.y), (seed, offset)
+            offset += 1
+
+
+def test_failed_storage_is_reported_and_flushed():
+    async def main():
+        connection = MemoryConnection(keep=True)
+        session = connection.session = Session(connection, StubServer())
+        failing = asyncio.get_running_loop().create_future()
+        failing.set_exception(OSError("disk full"))
+        results = []
+        session.when_done(failing, results.append, lambda exception: session.display.write(b'FAILED'))
+        session.display.write(b'PENDING')
+        await asyncio.sleep(0)
+
+        assert results == []
+        terminal = FrameBuffer()
+        terminal.write(connection.output)
+        assert terminal.chars == session.display.chars
+        assert b'PENDINGFAILED' in session.display.chars
+
+    asyncio.run(main())
+
+
+def test_wall_viewers_are_redrawn_together():
+    async def main():
+        server = StubServer()
+        for number in range(30):
+            server.wall.post(f"Entry {number}")
+        sessions = []
+        for number in range(12):
+            connection = MemoryConnection(keep=True)
+            session = Session(connection, server)
+            if number % 3 == 0:
+                session.display.write(LOUP_CHARSET)
+            if number % 4 == 0:
+                # A screen that has scrolled, so its count differs:
+                session.display.write(CURSOR_DOWN * (30 + number))
+            session.set_screen('wall')
+            session.screen_state.page = number % 2
+            session.flush()
+            sessions.append(session)
+
+        server.wall.post('A "new" entry')
+        for session in sessions:
+            session.screen_state.listener(30)
+        await asyncio.sleep(0)
+
+        for session in sessions:
+            # The same as drawing the page afresh:
+            alone = Session(MemoryConnection(), server)
+            alone.set_screen('wall')
+            alone.screen_state.page = session.screen_state.page
+            alone.display.assign(session.display)
+            alone.current_screen._draw_page(alone)
+            assert alone.display.matches(session.display)
+
+            terminal = FrameBuffer()
+            terminal.write(session.connection.output)
+            assert terminal.chars == session.display.chars
+            assert (terminal.x, terminal.y) == (session.display.x, session.display.y)
+
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+import random
+import asyncio
+
+from gibson.pacing import Pacer
+from gibson.server import AsyncConnection
+from gibson.telnet import (BINARY, DO, DONT, ECHO, IAC, SB, SE, SGA, WILL, WONT,
+                           TelnetFilter, escape_iac)
+
+
+_NOP = 241
+_commands = [bytes((IAC, _NOP)), bytes((IAC, WILL, SGA)), bytes((IAC, DO, ECHO)),
+             bytes((IAC, WONT, 31)), bytes((IAC, DONT, 24)), bytes((IAC, SB, 24, 1, IAC, SE))]
+
+
+def _binary_filter(replies):
+    telnet = TelnetFilter(replies.append)
+    telnet.negotiate()
+    telnet.receive(bytes((IAC, WILL, BINARY, IAC, DO, BINARY)))
+    assert telnet.binary
+    return telnet
+
+
+def test_commands_are_stripped_however_the_input_is_split():
+    rng = random.Random(24)
+    for _case in range(200):
+        data = bytes(rng.randrange(255) for _ in range(rng.randrange(1, 60)))
+        stream = bytearray()
+        for position in range(0, len(data), 7):
+            stream += rng.choice(_commands) + escape_iac(data[position:position + 7])
+        replies = []
+        telnet = _binary_filter(replies)
+
+        received = bytearray()
+        position = 0
+        while position < len(stream):
+            size = rng.randrange(1, 9)
+            received += telnet.receive(bytes(stream[position:position + size]))
+            position += size
+        assert received == data
+
+
+def test_escaping_doubles_iac():
+    telnet = _binary_filter([])
+    assert telnet.escape(b'A\xffB\xff') == b'A\xff\xffB\xff\xff'
+    assert telnet.receive(telnet.escape(bytes(range(256)))) == bytes(range(256))
+
+
+def test_cr_nul_split_by_a_command():
+    telnet = TelnetFilter(lambda reply: None)
+    assert telnet.receive(b'A\r') == b'A\r'
+    assert telnet.receive(bytes((IAC, _NOP))) == b''
+    assert telnet.receive(b'\0B') == b'B'
+
+
+def test_escapes_are_paced():
+    # At 9600 bps, 960 bytes a second: 0xFF goes out as two bytes, so
+    # 192 of them should take about 0.4 seconds, not 0.2:
+    async def main():
+        pacer = Pacer()
+        sent = asyncio.get_running_loop().create_future()
+
+        async def handle(reader, writer):
+            connection = AsyncConnection(reader, writer, 9600, pacer, telnet=True)
+            connection.send(b'\xff' * 192)
+            sent.set_result(connection)
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.sockets[0].getsockname()[1])
+        connection = await sent
+        start = asyncio.get_running_loop().time()
+        received = b''
+        while not received.endswith(b'\xff' * 384):
+            received += await asyncio.wait_for(reader.read(4096), 5)
+        elapsed = asyncio.get_running_loop().time() - start
+        connection.close()
+        writer.close()
+        server.close()
+        return elapsed
+
+    assert asyncio.run(main()) > 0.3